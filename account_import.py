@@ -0,0 +1,299 @@
+# account_import.py
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from connections import SessionLocal
+from models import CompleteProfile, Teacher, User
+from passwords import make_password_hash
+from stats import student_added, teacher_added, user_registered
+
+# =========================
+# Bulk account import
+# =========================
+# An admin uploads a CSV with one account per row:
+#   role, username, password, then the profile columns for that role
+#   student: first_name, middle_name, last_name, contact_no, guardian_name, form
+#   teacher: teacher_name, phone_number, subject
+# The file is copied under instance/imports/ and a background thread streams
+# it in batches: bulk username/phone collision checks, password hashing in a
+# process pool, then one transaction per batch inserting User rows plus their
+# profiles. Progress is written to <job>.json next to the file so any worker
+# can answer the polling request.
+#
+# Re-importing the same file is safe: accounts that already exist are skipped,
+# so a job cut short (worker restart) can simply be uploaded again.
+
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "500"))
+IMPORT_HASH_PROCESSES = int(os.environ.get("IMPORT_HASH_PROCESSES", "0")) or max(1, (os.cpu_count() or 2) - 1)
+# Only the first errors are kept in the progress file
+MAX_REPORTED_ERRORS = 200
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("student", "teacher")
+REQUIRED_COLUMNS = {
+    "student": ("first_name", "last_name", "contact_no", "guardian_name", "form"),
+    "teacher": ("teacher_name", "phone_number", "subject"),
+}
+PROFILE_COLUMNS = {
+    "student": REQUIRED_COLUMNS["student"] + ("middle_name",),
+    "teacher": REQUIRED_COLUMNS["teacher"],
+}
+PROFILE_MODELS = {"student": CompleteProfile, "teacher": Teacher}
+
+# One import at a time per process: the hash pool already uses the spare cores
+_run_lock = threading.Lock()
+
+
+class ImportFileError(ValueError):
+    """The uploaded file can't be imported at all."""
+
+
+def import_folder(instance_path):
+    folder = os.path.join(instance_path, "imports")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _job_paths(folder, job_id):
+    return os.path.join(folder, f"{job_id}.csv"), os.path.join(folder, f"{job_id}.json")
+
+
+def _write_progress(path, progress):
+    progress["updated_at"] = time.time()
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, "w") as f:
+        json.dump(progress, f)
+    os.replace(partial, path)  # readers never see a half-written file
+
+
+def read_progress(folder, job_id):
+    """Progress dict for `job_id`, or None if there is no such job."""
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return None
+    try:
+        with open(_job_paths(folder, job_id)[1]) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# -----------------------
+# Row validation
+# -----------------------
+def _clean(row):
+    return {(k or "").strip().lower(): (v or "").strip() for k, v in row.items() if k}
+
+
+def _check_lengths(model, values):
+    """Error message for a value longer than its column allows, or None.
+
+    Checked per row: an over-long value would otherwise fail the whole batch
+    (DataError on Postgres) instead of being reported for its line.
+    """
+    for name, value in values.items():
+        length = model.__table__.c[name].type.length
+        if value and length and len(value) > length:
+            return f"{name} is longer than {length} characters"
+    return None
+
+
+def _check_row(row, default_role):
+    """(account dict, None) for a usable row, else (None, error message)."""
+    role = (row.get("role") or default_role).lower()
+    if role not in ROLES:
+        return None, f"role must be student or teacher, not {role!r}"
+    if not row.get("username"):
+        return None, "username is required"
+    if not row.get("password"):
+        return None, "password is required"
+    missing = [c for c in REQUIRED_COLUMNS[role] if not row.get(c)]
+    if missing:
+        return None, f"missing {', '.join(missing)}"
+    profile = {c: row.get(c) or None for c in PROFILE_COLUMNS[role]}
+    error = _check_lengths(User, {"username": row["username"]}) or _check_lengths(PROFILE_MODELS[role], profile)
+    if error:
+        return None, error
+    return {"role": role, "username": row["username"], "password": row["password"], "profile": profile}, None
+
+
+def _drop_collisions(db, accounts, seen_usernames, seen_phones):
+    """Split accounts into (new, [(line, username, error)]) with one query per kind."""
+    usernames = {a["username"] for _, a in accounts}
+    taken = set(db.execute(select(User.username).where(User.username.in_(usernames))).scalars())
+    phones = {a["profile"]["phone_number"] for _, a in accounts if a["role"] == "teacher"}
+    if phones:
+        taken_phones = set(
+            db.execute(select(Teacher.phone_number).where(Teacher.phone_number.in_(phones))).scalars()
+        )
+    else:
+        taken_phones = set()
+
+    fresh, errors = [], []
+    for line, account in accounts:
+        username = account["username"]
+        phone = account["profile"].get("phone_number")
+        if username in taken or username in seen_usernames:
+            errors.append((line, username, "username already exists"))
+        elif phone and (phone in taken_phones or phone in seen_phones):
+            errors.append((line, username, "teacher phone number already exists"))
+        else:
+            seen_usernames.add(username)
+            if phone:
+                seen_phones.add(phone)
+            fresh.append((line, account))
+    return fresh, errors
+
+
+def _insert_accounts(db, accounts, hashes):
+    """Users, then profiles, then counters: a handful of statements per batch."""
+    user_ids = db.execute(
+        insert(User).returning(User.id, sort_by_parameter_order=True),
+        [{"username": a["username"], "password": hashes[line], "role": a["role"]} for line, a in accounts],
+    ).scalars().all()
+
+    students, teachers = [], []
+    for (_, account), user_id in zip(accounts, user_ids):
+        row = dict(account["profile"], user_id=user_id)
+        (students if account["role"] == "student" else teachers).append(row)
+    if students:
+        db.execute(insert(CompleteProfile), students)
+        for form, count in Counter(s["form"] for s in students).items():
+            student_added(db, form, count=count)
+        user_registered(db, "student", len(students))
+    if teachers:
+        db.execute(insert(Teacher), teachers)
+        teacher_added(db, count=len(teachers))
+        user_registered(db, "teacher", len(teachers))
+
+
+# -----------------------
+# Job lifecycle
+# -----------------------
+def start_import(file, instance_path, default_role="student"):
+    """Save the uploaded CSV and start importing it in the background; returns the job id."""
+    folder = import_folder(instance_path)
+    job_id = str(uuid.uuid4())
+    csv_path, progress_path = _job_paths(folder, job_id)
+
+    file.stream.seek(0)
+    with open(csv_path, "wb") as out:
+        for chunk in iter(lambda: file.stream.read(64 * 1024), b""):
+            out.write(chunk)
+
+    with open(csv_path, "rb") as f:
+        header = f.readline().decode("utf-8-sig", errors="replace").lower()
+    if "username" not in header or "password" not in header:
+        os.remove(csv_path)
+        raise ImportFileError("CSV needs a header row with at least username and password columns.")
+
+    _write_progress(progress_path, {
+        "job_id": job_id, "status": "queued", "filename": file.filename,
+        "bytes_total": os.path.getsize(csv_path), "bytes_read": 0,
+        "rows_read": 0, "created": 0, "skipped": 0, "errors": [], "started_at": time.time(),
+    })
+    threading.Thread(
+        target=run_import, args=(csv_path, progress_path, default_role), name=f"import-{job_id[:8]}", daemon=True
+    ).start()
+    return job_id
+
+
+def run_import(csv_path, progress_path, default_role="student"):
+    with open(progress_path) as f:
+        progress = json.load(f)
+    with _run_lock:
+        progress["status"] = "running"
+        _write_progress(progress_path, progress)
+        try:
+            _import_file(csv_path, progress, progress_path, default_role)
+            progress["status"] = "done"
+        except Exception as e:
+            progress["status"] = "failed"
+            progress["error"] = str(e)
+            logger.exception("import %s failed", progress["job_id"])
+        finally:
+            progress["finished_at"] = time.time()
+            _write_progress(progress_path, progress)
+            os.remove(csv_path)
+
+
+def _record_errors(progress, errors):
+    progress["skipped"] += len(errors)
+    room = MAX_REPORTED_ERRORS - len(progress["errors"])
+    progress["errors"].extend({"line": line, "username": username, "error": error}
+                              for line, username, error in sorted(errors)[:max(room, 0)])
+
+
+def _import_file(csv_path, progress, progress_path, default_role):
+    # spawn: never fork a process that has DB connections and threads
+    context = multiprocessing.get_context("spawn")
+    seen_usernames, seen_phones = set(), set()
+    with open(csv_path, "rb") as raw, \
+            ProcessPoolExecutor(IMPORT_HASH_PROCESSES, mp_context=context) as pool:
+        text = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+        reader = csv.DictReader(text)
+        line = 1
+        while True:
+            batch = list(islice(reader, IMPORT_BATCH_SIZE))
+            if not batch:
+                break
+
+            accounts, errors = [], []
+            for row in batch:
+                line += 1
+                row = _clean(row)
+                account, error = _check_row(row, default_role)
+                if error:
+                    errors.append((line, row.get("username", ""), error))
+                else:
+                    accounts.append((line, account))
+
+            db = SessionLocal()
+            try:
+                hashes = {}
+                for attempt in range(2):
+                    fresh, collisions = _drop_collisions(db, accounts, set(seen_usernames), set(seen_phones))
+                    db.rollback()  # don't sit in a transaction while hashing
+                    todo = [(l, a) for l, a in fresh if l not in hashes]
+                    chunksize = max(1, len(todo) // (IMPORT_HASH_PROCESSES * 4))
+                    hashes.update(zip(
+                        (l for l, _ in todo),
+                        pool.map(make_password_hash, [a["password"] for _, a in todo], chunksize=chunksize),
+                    ))
+                    try:
+                        if fresh:
+                            _insert_accounts(db, fresh, hashes)
+                        db.commit()
+                        break
+                    except IntegrityError:
+                        # Someone registered one of these names meanwhile: recheck once
+                        db.rollback()
+                        if attempt:
+                            raise
+            finally:
+                SessionLocal.remove()
+
+            for _, account in fresh:
+                seen_usernames.add(account["username"])
+                if account["role"] == "teacher":
+                    seen_phones.add(account["profile"]["phone_number"])
+            _record_errors(progress, errors + collisions)
+            progress["created"] += len(fresh)
+            progress["rows_read"] += len(batch)
+            progress["bytes_read"] = raw.tell()
+            _write_progress(progress_path, progress)
@@ -1,19 +1,52 @@
 # app.py
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-from connections import SessionLocal
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify, g,
+                   get_template_attribute, send_file, send_from_directory, abort)
+from connections import SessionLocal, engine, replica_engines
+from content_versions import SECTIONS, read_content_versions, versions_etag
+from cache import get_catalog, get_content_fragments, get_material_file, invalidate_catalog, invalidate_material
+from batch import apply_batch
+from account_import import ROLES, ImportFileError, import_folder, read_progress, start_import
+from live_events import TooManyStreams, event_stream
+from metrics import init_metrics, query_budget, render_metrics
+from querylog import init_query_log, query_stats, render_query_stats, reset_query_stats
+from replicas import init_replica_routing, read_only
+from pagination import keyset_page
+from profiler import init_profiler, profile_folder
+from compression import init_compression
+from payments import PaymentsFileError, TERM_FEE, read_payments_csv, reconcile_payments, set_students_active
+from search import search_students
+from stats import (read_dashboard_stats, student_added, student_changed, teacher_added,
+                   teacher_changed, user_registered)
+from session_state import account_query, bump_session_version, current_account, remember_account
+from storage import TMP_DIRNAME, UploadRequest, store_upload
 from models import User, CompleteProfile, LiveClass, RevisionMaterial, Video, Teacher
 from datetime import datetime
 from functools import wraps
-from sqlalchemy import func, or_
-from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import safe_join
+
+from passwords import HashingBusy, hash_password, needs_rehash, verify_password
+import hmac
+import mimetypes
 import os
 
 # -----------------------
 # Config / Uploads
 # -----------------------
 ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx'}
-UPLOAD_FOLDER = 'static/materials'
+# Anchored to the app so uploads land under the static folder whatever the cwd.
+# The static view refuses this folder (compression.serve_static): uploads are
+# only served by download_material, after its login check. A proxy that serves
+# /static/ itself must deny /static/materials/ too.
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'materials')
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "50"))
+
+# How uploaded materials reach the client:
+#   ""       -> this worker streams the file (Range/ETag handled by Werkzeug)
+#   "nginx"  -> X-Accel-Redirect to MATERIAL_ACCEL_PREFIX (an `internal` nginx location)
+#   "apache" -> X-Sendfile with the absolute path (mod_xsendfile)
+MATERIAL_SENDFILE = os.environ.get("MATERIAL_SENDFILE", "").lower()
+MATERIAL_ACCEL_PREFIX = os.environ.get("MATERIAL_ACCEL_PREFIX", "/protected/")
+MATERIAL_MAX_AGE = int(os.environ.get("MATERIAL_MAX_AGE", "86400"))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -21,7 +54,53 @@ def allowed_file(filename):
 app = Flask(__name__)
 app.secret_key = "silaswanyamarechosilasayangaamukowaivansamuel"
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Every multipart file part (materials, import and payment CSVs) is streamed
+# straight to disk here and hashed on the way in. Outside static/, but on the
+# same filesystem so a stored material is a hard link, not a copy.
+app.config['UPLOAD_TMP_FOLDER'] = os.path.join(app.instance_path, 'uploads', TMP_DIRNAME)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_MB * 1024 * 1024
+app.request_class = UploadRequest
+app.config['USE_X_SENDFILE'] = MATERIAL_SENDFILE == "apache"
+os.makedirs(app.config['UPLOAD_TMP_FOLDER'], exist_ok=True)
+
+# Per-route query count / DB time / pool wait histograms, served at /metrics
+init_metrics(app, engine, *replica_engines)
+# Per-statement fingerprint stats + slow-query log (SLOW_QUERY_MS), served at /metrics/queries
+init_query_log(engine, *replica_engines)
+# @read_only views read from DATABASE_REPLICA_URLS, except right after the user's own writes
+init_replica_routing(app)
+# Opt-in stack sampling of single requests (X-Profile / PROFILE_TOKEN), saved under instance/profiles/
+init_profiler(app)
+# gzip/brotli for large text responses; precompressed .br/.gz for static files (precompress.py)
+init_compression(app)
+# Lets a Prometheus scraper read /metrics without an admin session
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# -----------------------
+# Request-scoped DB session
+# -----------------------
+def get_db():
+    """Session for the current request.
+
+    Created on first call and bound to the app context; it only checks a
+    connection out of the pool when the first query runs.
+    """
+    if "db" not in g:
+        g.db = SessionLocal()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exc):
+    if g.pop("db", None) is None:
+        return
+    try:
+        if exc is None:
+            SessionLocal.commit()
+        else:
+            SessionLocal.rollback()
+    finally:
+        # Returns the connection to the pool and drops the thread's session
+        SessionLocal.remove()
 
 # -----------------------
 # Role-based decorator
@@ -54,66 +133,65 @@ def login():
         username = request.form.get("username", "").strip()
         password = request.form.get("password", "").strip()
 
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter_by(username=username).first()
-
-            if user:
-                # Try secure check first, fallback to plain equality (backwards compatibility)
-                valid = False
-                try:
-                    valid = check_password_hash(user.password, password)
-                except Exception:
-                    valid = False
-
-                if not valid:
-                    # fallback: maybe password is stored as plain text in older DBs
-                    valid = (user.password == password)
-
-                if valid:
-                    session["user_id"] = user.id
-                    session["role"] = user.role
-
-                    # Admin login
-                    if user.role == "admin":
-                        return redirect(url_for("admin_dashboard"))
-
-                    # Teacher login
-                    elif user.role == "teacher":
-                        teacher_profile = db.query(Teacher).filter_by(user_id=user.id).first()
-
-                        if not teacher_profile:
-                            # Teacher has not yet completed their profile
-                            return redirect(url_for("complete_teacher_profile", user_id=user.id))
-
-                        # ✅ Require admin approval before access
-                        if not teacher_profile.is_approved:
-                            flash("Your profile is awaiting admin approval. Please wait before accessing your dashboard.", "warning")
-                            session.clear()
-                            return redirect(url_for("login"))
-
-                        # Approved teachers can access dashboard
-                        return redirect(url_for("teacher_dashboard"))
-
-                    # Student login
-                    elif user.role == "student":
-                        profile = db.query(CompleteProfile).filter_by(user_id=user.id).first()
-
-                        if profile:
-                            return redirect(url_for("student_dashboard"))
-                        else:
-                            return redirect(url_for("complete_profile"))
+        db = get_db()
+        # User, teacher profile and student profile in a single round trip
+        row = account_query(db).filter(User.username == username).first()
 
+        if row:
+            user, teacher_profile, profile = row
+            # Hashes are checked on the bounded hashing pool; legacy plaintext rows still work
+            try:
+                valid = verify_password(user.password, password)
+            except HashingBusy:
+                flash("Too many sign-in attempts right now. Please try again in a moment.", "warning")
+                return render_template("login.html"), 503
+
+            if valid:
+                session["user_id"] = user.id
+                session["role"] = user.role
+                account = remember_account(user, teacher_profile, profile)
+
+                if needs_rehash(user.password):
+                    # Upgrade plaintext / outdated-cost hashes while we have the password
+                    try:
+                        user.password = hash_password(password)
+                        db.commit()
+                    except HashingBusy:
+                        pass  # try again on the next login
+
+                # Admin login
+                if account["role"] == "admin":
+                    return redirect(url_for("admin_dashboard"))
+
+                # Teacher login
+                elif account["role"] == "teacher":
+                    if not account["has_profile"]:
+                        # Teacher has not yet completed their profile
+                        return redirect(url_for("complete_teacher_profile", user_id=session["user_id"]))
+
+                    # ✅ Require admin approval before access
+                    if not account["approved"]:
+                        flash("Your profile is awaiting admin approval. Please wait before accessing your dashboard.", "warning")
+                        session.clear()
+                        return redirect(url_for("login"))
+
+                    # Approved teachers can access dashboard
+                    return redirect(url_for("teacher_dashboard"))
+
+                # Student login
+                elif account["role"] == "student":
+                    if account["has_profile"]:
+                        return redirect(url_for("student_dashboard"))
                     else:
-                        return "Role not recognized", 403
+                        return redirect(url_for("complete_profile"))
 
                 else:
-                    flash("Invalid credentials", "danger")
+                    return "Role not recognized", 403
+
             else:
                 flash("Invalid credentials", "danger")
-
-        finally:
-            db.close()
+        else:
+            flash("Invalid credentials", "danger")
 
     return render_template("login.html")
 
@@ -132,31 +210,33 @@ def register():
         if password != confirm_password:
             message = "Passwords do not match"
         else:
-            db = SessionLocal()
-            try:
-                existing_user = db.query(User).filter_by(username=username).first()
-                if existing_user:
-                    message = "Username already exists"
+            db = get_db()
+            existing_user = db.query(User).filter_by(username=username).first()
+            if existing_user:
+                message = "Username already exists"
+            else:
+                # store hashed password
+                try:
+                    hashed = hash_password(password)
+                except HashingBusy:
+                    message = "Server is busy, please try again in a moment."
+                    return render_template('register.html', message=message), 503
+                new_user = User(username=username, password=hashed, role=role)
+                db.add(new_user)
+                user_registered(db, role)
+                db.commit()
+
+                # Redirect based on role
+                # We'll redirect teacher to login so they can login then complete profile
+                if role == "teacher":
+                    flash("Account created. Please login and complete your profile.", "success")
+                    return redirect(url_for('login'))
+                elif role == "student":
+                    flash("Account created. Please login.", "success")
+                    return redirect(url_for('login'))
                 else:
-                    # store hashed password
-                    hashed = generate_password_hash(password)
-                    new_user = User(username=username, password=hashed, role=role)
-                    db.add(new_user)
-                    db.commit()
-
-                    # Redirect based on role
-                    # We'll redirect teacher to login so they can login then complete profile
-                    if role == "teacher":
-                        flash("Account created. Please login and complete your profile.", "success")
-                        return redirect(url_for('login'))
-                    elif role == "student":
-                        flash("Account created. Please login.", "success")
-                        return redirect(url_for('login'))
-                    else:
-                        flash("Account created. Please login.", "success")
-                        return redirect(url_for('login'))
-            finally:
-                db.close()
+                    flash("Account created. Please login.", "success")
+                    return redirect(url_for('login'))
 
     return render_template('register.html', message=message)
 
@@ -176,16 +256,13 @@ def forgot_password():
     message = ""
     if request.method == 'POST':
         username = request.form['username']
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter_by(username=username).first()
-            if user:
-                # For now we redirect to reset page (no email). You might want to implement email.
-                return redirect(url_for('reset_password', username=username))
-            else:
-                message = "No account found with that username."
-        finally:
-            db.close()
+        db = get_db()
+        user = db.query(User).filter_by(username=username).first()
+        if user:
+            # For now we redirect to reset page (no email). You might want to implement email.
+            return redirect(url_for('reset_password', username=username))
+        else:
+            message = "No account found with that username."
     return render_template('forgot_password.html', message=message)
 
 @app.route('/reset_password/<username>', methods=['GET', 'POST'])
@@ -198,15 +275,16 @@ def reset_password(username):
         if new_password != confirm_password:
             message = "Passwords do not match."
         else:
-            db = SessionLocal()
-            try:
-                user = db.query(User).filter_by(username=username).first()
-                if user:
-                    user.password = generate_password_hash(new_password)
-                    db.commit()
-                    flash("Password updated successfully! You can now log in.", "success")
-            finally:
-                db.close()
+            db = get_db()
+            user = db.query(User).filter_by(username=username).first()
+            if user:
+                try:
+                    user.password = hash_password(new_password)
+                except HashingBusy:
+                    message = "Server is busy, please try again in a moment."
+                    return render_template('reset_password.html', message=message, username=username), 503
+                db.commit()
+                flash("Password updated successfully! You can now log in.", "success")
             return redirect(url_for('login'))
     return render_template('reset_password.html', message=message, username=username)
 
@@ -219,217 +297,283 @@ def complete_profile():
         return redirect(url_for('login'))
 
     user_id = session['user_id']
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter_by(id=user_id).first()
-        if not user:
-            flash("User not found", "danger")
-            return redirect(url_for('login'))
+    db = get_db()
+    user = db.query(User).filter_by(id=user_id).first()
+    if not user:
+        flash("User not found", "danger")
+        return redirect(url_for('login'))
 
-        profile = db.query(CompleteProfile).filter_by(user_id=user.id).first()
-
-        if request.method == 'POST':
-            first_name = request.form.get('first_name', '').strip()
-            middle_name = request.form.get('middle_name', '').strip()
-            last_name = request.form.get('last_name', '').strip()
-            contact_no = request.form.get('contact_no', '').strip()
-            guardian_name = request.form.get('guardian_name', '').strip()
-            form_selected = request.form.get('form', '').strip()
-
-            if not first_name or not last_name or not contact_no or not guardian_name or not form_selected:
-                flash("Please fill all required fields", "danger")
-                profile_data = profile.__dict__ if profile else {}
-                return render_template('students/complete_profile.html', profile=profile_data)
-
-            if profile:
-                profile.first_name = first_name
-                profile.middle_name = middle_name
-                profile.last_name = last_name
-                profile.contact_no = contact_no
-                profile.guardian_name = guardian_name
-                profile.form = form_selected
-            else:
-                profile = CompleteProfile(
-                    user_id=user.id,
-                    first_name=first_name,
-                    middle_name=middle_name,
-                    last_name=last_name,
-                    contact_no=contact_no,
-                    guardian_name=guardian_name,
-                    form=form_selected
-                )
-                db.add(profile)
+    profile = db.query(CompleteProfile).filter_by(user_id=user.id).first()
 
-            db.commit()
-            flash("Profile saved successfully!", "success")
-            return redirect(url_for("student_dashboard"))
+    if request.method == 'POST':
+        first_name = request.form.get('first_name', '').strip()
+        middle_name = request.form.get('middle_name', '').strip()
+        last_name = request.form.get('last_name', '').strip()
+        contact_no = request.form.get('contact_no', '').strip()
+        guardian_name = request.form.get('guardian_name', '').strip()
+        form_selected = request.form.get('form', '').strip()
+
+        if not first_name or not last_name or not contact_no or not guardian_name or not form_selected:
+            flash("Please fill all required fields", "danger")
+            profile_data = profile.__dict__ if profile else {}
+            return render_template('students/complete_profile.html', profile=profile_data)
+
+        if profile:
+            old_form, old_active = profile.form, profile.is_active
+            profile.first_name = first_name
+            profile.middle_name = middle_name
+            profile.last_name = last_name
+            profile.contact_no = contact_no
+            profile.guardian_name = guardian_name
+            profile.form = form_selected
+            student_changed(db, old_form, old_active, form_selected, profile.is_active)
+        else:
+            profile = CompleteProfile(
+                user_id=user.id,
+                first_name=first_name,
+                middle_name=middle_name,
+                last_name=last_name,
+                contact_no=contact_no,
+                guardian_name=guardian_name,
+                form=form_selected
+            )
+            db.add(profile)
+            student_added(db, form_selected)
 
-        profile_data = profile.__dict__ if profile else {}
-        return render_template('students/complete_profile.html', profile=profile_data)
-    finally:
-        db.close()
+        remember_account(user, None, profile)
+        db.commit()
+        flash("Profile saved successfully!", "success")
+        return redirect(url_for("student_dashboard"))
+
+    profile_data = profile.__dict__ if profile else {}
+    return render_template('students/complete_profile.html', profile=profile_data)
 
 # -----------------------
 # Complete Teacher Profile
 # -----------------------
 @app.route("/complete_teacher_profile/<int:user_id>", methods=["GET", "POST"])
 def complete_teacher_profile(user_id):
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter_by(id=user_id, role="teacher").first()
-        if not user:
-            flash("Invalid or missing teacher account.", "danger")
-            return redirect(url_for("login"))
-
-        existing = db.query(Teacher).filter_by(user_id=user.id).first()
-        if existing:
-            flash("Profile already exists. Please login.", "info")
-            return redirect(url_for("login"))
-
-        if request.method == "POST":
-            teacher_name = request.form.get("teacher_name").strip()
-            phone_number = request.form.get("phone_number").strip()
-            subject = request.form.get("subject").strip()
-
-            new_teacher = Teacher(
-                user_id=user.id,
-                teacher_name=teacher_name,
-                phone_number=phone_number,
-                subject=subject
-            )
-            db.add(new_teacher)
-            db.commit()
-            flash("Profile completed successfully!", "success")
-            return redirect(url_for("login"))
+    db = get_db()
+    user = db.query(User).filter_by(id=user_id, role="teacher").first()
+    if not user:
+        flash("Invalid or missing teacher account.", "danger")
+        return redirect(url_for("login"))
 
-        return render_template("teachers/teachers.html", user=user)
-    finally:
-        db.close()
+    existing = db.query(Teacher).filter_by(user_id=user.id).first()
+    if existing:
+        flash("Profile already exists. Please login.", "info")
+        return redirect(url_for("login"))
+
+    if request.method == "POST":
+        teacher_name = request.form.get("teacher_name").strip()
+        phone_number = request.form.get("phone_number").strip()
+        subject = request.form.get("subject").strip()
+
+        new_teacher = Teacher(
+            user_id=user.id,
+            teacher_name=teacher_name,
+            phone_number=phone_number,
+            subject=subject
+        )
+        db.add(new_teacher)
+        teacher_added(db)
+        db.commit()
+        flash("Profile completed successfully!", "success")
+        return redirect(url_for("login"))
+
+    return render_template("teachers/teachers.html", user=user)
 
 # -----------------------
 # Student Dashboard
 # -----------------------
 @app.route("/student")
+@query_budget(6)  # session version check + contact details + content versions + three catalog lists on a cache miss
+@read_only
 def student_dashboard():
     if not session.get("user_id"):
         return redirect(url_for("login"))
 
-    db = SessionLocal()
-    try:
-        user = db.query(User).filter_by(id=session["user_id"]).first()
-        if not user:
-            return redirect(url_for("login"))
-
-        profile = db.query(CompleteProfile).filter_by(user_id=user.id).first()
-        if not profile:
-            return redirect(url_for("complete_profile"))
-
-        student_form = (profile.form or "").strip().lower()
-
-        if not profile.is_active:
-            flash("Your account is not active. Please contact admin to make payment.", "warning")
-            return render_template(
-                "students/student_dashboard.html",
-                student={
-                    "full_name": f"{profile.first_name} {profile.last_name}",
-                    "form": profile.form,
-                    "phone": profile.contact_no,
-                    "guardian_name": profile.guardian_name,
-                    "is_active": profile.is_active
-                },
-                live_classes=[],
-                revision_materials=[],
-                videos=[],
-                current_year=datetime.now().year
-            )
+    db = get_db()
+    # Profile details come from the session until an admin action bumps its version
+    account = current_account(db)
+    if not account:
+        return redirect(url_for("login"))
 
-        live_classes = db.query(LiveClass).filter(
-            func.lower(func.trim(LiveClass.form)).in_([student_form, "all", ""])
-        ).all()
-
-        revision_materials = db.query(RevisionMaterial).filter(
-            func.lower(func.trim(RevisionMaterial.form)).in_([student_form, "all", ""])
-        ).all()
-
-        videos = db.query(Video).filter(
-            func.lower(func.trim(Video.form)).in_([student_form, "all", ""])
-        ).all()
-
-        return render_template(
-            "students/student_dashboard.html",
-            student={
-                "full_name": f"{profile.first_name} {profile.last_name}",
-                "form": profile.form,
-                "phone": profile.contact_no,
-                "guardian_name": profile.guardian_name,
-                "is_active": profile.is_active
-            },
-            live_classes=live_classes,
-            revision_materials=revision_materials,
-            videos=videos,
-            current_year=datetime.now().year
-        )
-    finally:
-        db.close()
+    if "form" not in account:
+        return redirect(url_for("complete_profile"))
+
+    # Contact details stay out of the (readable) session cookie
+    contact = db.query(CompleteProfile.contact_no, CompleteProfile.guardian_name).filter(
+        CompleteProfile.user_id == session["user_id"]).first()
+    student = {
+        "full_name": account["name"],
+        "form": account["form"],
+        "phone": contact.contact_no if contact else None,
+        "guardian_name": contact.guardian_name if contact else None,
+        "is_active": account["is_active"]
+    }
+
+    # Content sections are the same HTML for every student in the form: rendered
+    # once per content version, only the header above is per student
+    versions = read_content_versions(db, account["form"])
+    content_etag = versions_etag(account["form"], versions, account["is_active"])
+
+    if not account["is_active"]:
+        flash("Your account is not active. Please contact admin to make payment.", "warning")
+        sections = {
+            section: {"version": versions[section], "html": render_content_section(section, []), "count": 0}
+            for section in SECTIONS
+        }
+    else:
+        sections = get_content_fragments(db, account["form"], versions, render_content_section)
+
+    return render_template(
+        "students/student_dashboard.html",
+        student=student,
+        sections=sections,
+        content_etag=content_etag,
+        current_year=datetime.now().year
+    )
+
+def render_content_section(section, items):
+    render = get_template_attribute("students/_content_sections.html", f"{section}_section")
+    return render(items)
+
+def _material_item(material):
+    """A catalog material for the content API, with the URL a student opens."""
+    if material["file_path"]:
+        # Uploaded files only go out through the checked download route
+        item = {key: value for key, value in material.items() if key not in ("link", "embed_url", "download_url")}
+        item["url"] = url_for("download_material", material_id=material["id"])
+        return item
+    return dict(material, url=material["embed_url"] or material["link"])
+
+@app.route("/api/student/content")
+@query_budget(5)  # same as the dashboard; a 304 needs only the content versions
+@read_only
+def student_content():
+    """The dashboard's content sections as JSON, revalidated with If-None-Match.
+
+    The ETag comes from the per-form content versions, so an unchanged client
+    costs one primary-key query and gets an empty 304.
+    """
+    if not session.get("user_id"):
+        return jsonify({"success": False, "error": "Login required"}), 401
+
+    db = get_db()
+    account = current_account(db)
+    if not account or "form" not in account:
+        return jsonify({"success": False, "error": "Login required"}), 401
+
+    versions = read_content_versions(db, account["form"])
+    etag = versions_etag(account["form"], versions, account["is_active"])
+    # Weak match: the compression hook turns this ETag into W/"..."
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        sections = {}
+        if account["is_active"]:
+            catalog = get_catalog(db, account["form"], versions)
+            fragments = get_content_fragments(db, account["form"], versions, render_content_section)
+            for section in SECTIONS:
+                sections[section] = {"version": versions[section], "items": catalog[section],
+                                     "html": str(fragments[section]["html"])}
+        else:
+            for section in SECTIONS:
+                sections[section] = {"version": versions[section], "items": [],
+                                     "html": str(render_content_section(section, []))}
+        # Copies: the catalog's dicts are shared through the cache
+        sections["revision_materials"]["items"] = [
+            _material_item(material) for material in sections["revision_materials"]["items"]
+        ]
+        response = jsonify({"active": account["is_active"], "etag": etag, "sections": sections})
+
+    response.set_etag(etag)
+    # Always revalidate; never shared between students
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+@app.route("/api/student/events")
+@query_budget(1)  # session version check, before the stream starts
+@read_only
+def student_events():
+    """Server-Sent Events for the student's form (class_started, new_material, ...).
+
+    The body is a plain generator, so the request context and the DB session
+    are released as soon as the stream starts; only a hub queue stays open.
+    """
+    if not session.get("user_id"):
+        return jsonify({"success": False, "error": "Login required"}), 401
+
+    db = get_db()
+    account = current_account(db)
+    if not account or "form" not in account:
+        return jsonify({"success": False, "error": "Login required"}), 401
+    if not account["is_active"]:
+        return jsonify({"success": False, "error": "Account not active"}), 403
+
+    try:
+        stream = event_stream(account["form"])
+    except TooManyStreams:
+        # EventSource retries after `retry`; the page keeps polling meanwhile
+        return Response("Too many open streams\n", status=503, mimetype="text/plain",
+                        headers={"Retry-After": "30"})
+    return Response(stream, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # nginx: don't buffer the stream
+    })
 
 # -----------------------
 # Teacher Dashboard
 # -----------------------
 @app.route("/teacher_dashboard")
+@query_budget(3)  # session version check + live classes + materials
+@read_only
 def teacher_dashboard():
     if 'user_id' not in session or session.get('role') != 'teacher':
         return redirect(url_for('login'))
 
-    db = SessionLocal()
-    try:
-        teacher = db.query(Teacher).filter_by(user_id=session['user_id']).first()
-        # provide teacher relevant lists
-        live_classes = db.query(LiveClass).all()
-        revision_materials = db.query(RevisionMaterial).all()
-        # you can filter to teacher's items if you add a column (teacher_id) to models
-        return render_template('teachers/teachers_dashboard.html', teacher=teacher,
-                               live_classes=live_classes, revision_materials=revision_materials)
-    finally:
-        db.close()
+    db = get_db()
+    account = current_account(db)
+    if not account or not account["has_profile"]:
+        return redirect(url_for('login'))
+    if not account["approved"]:
+        flash("Your profile is awaiting admin approval. Please wait before accessing your dashboard.", "warning")
+        session.clear()
+        return redirect(url_for('login'))
+    teacher = {"teacher_name": account["name"], "subject": account["subject"]}
+    # provide teacher relevant lists
+    live_classes = db.query(LiveClass).all()
+    revision_materials = db.query(RevisionMaterial).all()
+    # you can filter to teacher's items if you add a column (teacher_id) to models
+    return render_template('teachers/teachers_dashboard.html', teacher=teacher,
+                           live_classes=live_classes, revision_materials=revision_materials)
 
 # -----------------------
 # Admin Dashboard
 # -----------------------
 @app.route('/admin')
 @role_required("admin")
+@query_budget(4)  # three content lists + one read of every stat counter
+@read_only
 def admin_dashboard():
-    db = SessionLocal()
-    try:
-        live_classes = db.query(LiveClass).all()
-        revision_materials = db.query(RevisionMaterial).all()
-        videos = db.query(Video).all()
-        current_year = datetime.now().year
-
-        # 🧩 Add counts for dashboard cards
-        total_students = db.query(CompleteProfile).count()
-        total_teachers = db.query(Teacher).count()
-
-        # 🧩 Add pending approval counts
-        pending_teachers = db.query(Teacher).filter_by(is_approved=False).count()
-        pending_students = (
-            db.query(CompleteProfile).filter_by(is_approved=False).count()
-            if hasattr(CompleteProfile, 'is_approved')
-            else 0
-        )
-
-        return render_template(
-            "admin/admin_dashboard.html",
-            live_classes=live_classes,
-            revision_materials=revision_materials,
-            videos=videos,
-            current_year=current_year,
-            total_students=total_students,
-            total_teachers=total_teachers,
-            pending_teachers=pending_teachers,
-            pending_students=pending_students
-        )
-    finally:
-        db.close()
+    db = get_db()
+    live_classes = db.query(LiveClass).all()
+    revision_materials = db.query(RevisionMaterial).all()
+    videos = db.query(Video).all()
+    current_year = datetime.now().year
+
+    # 🧩 Counts for dashboard cards, kept up to date by the write routes (stats.py)
+    stats = read_dashboard_stats(db)
+
+    return render_template(
+        "admin/admin_dashboard.html",
+        live_classes=live_classes,
+        revision_materials=revision_materials,
+        videos=videos,
+        current_year=current_year,
+        **stats
+    )
 
 # -----------------------
 # Admin CRUD - Live Classes
@@ -437,31 +581,29 @@ def admin_dashboard():
 @app.route("/admin/live_class/add", methods=["POST","GET"])
 @role_required("admin")
 def add_live_class():
-    db = SessionLocal()
-    try:
-        title = request.form.get("title")
-        link = request.form.get("link")
-        time = request.form.get("time")
-        form = request.form.get("form")
-        subject = request.form.get("subject")
-
-        if not title or not link:
-            flash("Title and Link are required!", "danger")
-            return redirect(url_for("admin_dashboard"))
-
-        new_class = LiveClass(
-            title=title,
-            link=link,
-            time=time,
-            form=form,
-            subject=subject
-        )
-
-        db.add(new_class)
-        db.commit()
-        flash("✅ Live class added successfully!", "success")
-    finally:
-        db.close()
+    title = request.form.get("title")
+    link = request.form.get("link")
+    time = request.form.get("time")
+    form = request.form.get("form")
+    subject = request.form.get("subject")
+
+    if not title or not link:
+        flash("Title and Link are required!", "danger")
+        return redirect(url_for("admin_dashboard"))
+
+    db = get_db()
+    new_class = LiveClass(
+        title=title,
+        link=link,
+        time=time,
+        form=form,
+        subject=subject
+    )
+
+    db.add(new_class)
+    db.commit()
+    invalidate_catalog(form)
+    flash("✅ Live class added successfully!", "success")
 
     return redirect(url_for("admin_dashboard"))
 
@@ -469,36 +611,35 @@ def add_live_class():
 @app.route("/admin/live_class/edit/<int:class_id>", methods=["GET", "POST"])
 @role_required("admin")
 def edit_live_class(class_id):
-    db = SessionLocal()
-    try:
-        cls = db.query(LiveClass).get(class_id)
-        if request.method == "POST":
-            cls.title = request.form.get("title")
-            cls.link = request.form.get("link")
-            cls.time = request.form.get("time")
-            cls.form = request.form.get("form")
-            cls.subject = request.form.get("subject")
-            db.commit()
-            flash("Live class updated!", "success")
-            return redirect(url_for("admin_dashboard"))
-        return render_template("edit_live_class.html", cls=cls)
-    finally:
-        db.close()
+    db = get_db()
+    cls = db.query(LiveClass).get(class_id)
+    if request.method == "POST":
+        old_form = cls.form
+        cls.title = request.form.get("title")
+        cls.link = request.form.get("link")
+        cls.time = request.form.get("time")
+        cls.form = request.form.get("form")
+        cls.subject = request.form.get("subject")
+        new_form = cls.form
+        db.commit()
+        invalidate_catalog(old_form, new_form)
+        flash("Live class updated!", "success")
+        return redirect(url_for("admin_dashboard"))
+    return render_template("edit_live_class.html", cls=cls)
 
 @app.route("/admin/live_class/delete/<int:class_id>", methods=["POST"])
 @role_required("admin")
 def delete_live_class(class_id):
-    db = SessionLocal()
-    try:
-        cls = db.query(LiveClass).get(class_id)
-        if cls:
-            db.delete(cls)
-            db.commit()
-            flash("Live class deleted!", "success")
-        else:
-            flash("Class not found.", "danger")
-    finally:
-        db.close()
+    db = get_db()
+    cls = db.query(LiveClass).get(class_id)
+    if cls:
+        old_form = cls.form
+        db.delete(cls)
+        db.commit()
+        invalidate_catalog(old_form)
+        flash("Live class deleted!", "success")
+    else:
+        flash("Class not found.", "danger")
     return redirect(url_for("admin_dashboard"))
 
 # -----------------------
@@ -508,80 +649,77 @@ def delete_live_class(class_id):
 @role_required("admin")
 def add_material():
     if request.method == 'POST':
-        db = SessionLocal()
-        try:
-            title = request.form.get('title', '').strip()
-            subject = request.form.get('subject', '').strip()
-            form_class = request.form.get('form', '').strip()
-            link = request.form.get('link', '').strip()
-            file = request.files.get('file')
-
-            if not title or not subject or not form_class:
-                flash("All fields are required", "danger")
-                return redirect(url_for('admin_dashboard'))
-
-            # Case 1: Google Drive link
-            if link:
-                if "drive.google.com/file/d/" in link:
-                    file_id = link.split("/d/")[1].split("/")[0]
-                    link = f"https://drive.google.com/uc?export=download&id={file_id}"
-
-            # Case 2: File upload
-            elif file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
-                link = url_for('static', filename=f'materials/{filename}')
-
-            else:
-                flash("You must provide either a file or a Google Drive link.", "danger")
-                return redirect(url_for('admin_dashboard'))
-
-            new_material = RevisionMaterial(
-                title=title,
-                subject=subject,
-                form=form_class,
-                link=link
-            )
-            db.add(new_material)
-            db.commit()
-            flash("Material added successfully!", "success")
-        finally:
-            db.close()
+        title = request.form.get('title', '').strip()
+        subject = request.form.get('subject', '').strip()
+        form_class = request.form.get('form', '').strip()
+        link = request.form.get('link', '').strip()
+        file = request.files.get('file')
+
+        if not title or not subject or not form_class:
+            flash("All fields are required", "danger")
+            return redirect(url_for('admin_dashboard'))
+
+        stored = None
+
+        # Case 1: Google Drive (or other) link: stored as given, the model derives
+        # the embed/download URLs from it
+        # Case 2: File upload (stored under its content hash, so re-uploads are deduplicated)
+        if not link and file and allowed_file(file.filename):
+            stored = store_upload(file, app.config['UPLOAD_FOLDER'])
+
+        elif not link:
+            flash("You must provide either a file or a Google Drive link.", "danger")
+            return redirect(url_for('admin_dashboard'))
+
+        db = get_db()
+        new_material = RevisionMaterial(
+            title=title,
+            subject=subject,
+            form=form_class,
+            link=link or None,  # uploads have no public URL, only download_material
+            file_path=f"materials/{stored.name}" if stored else None,
+            file_size=stored.size if stored else None,
+            file_sha256=stored.sha256 if stored else None
+        )
+        db.add(new_material)
+        db.commit()
+        invalidate_catalog(form_class)
+        flash("Material added successfully!", "success")
 
     return redirect(url_for('admin_dashboard'))
 
 @app.route("/admin/material/edit/<int:material_id>", methods=["GET", "POST"])
 @role_required("admin")
 def edit_material(material_id):
-    db = SessionLocal()
-    try:
-        mat = db.query(RevisionMaterial).get(material_id)
-        if request.method == "POST":
-            mat.title = request.form.get("title")
-            mat.link = request.form.get("link")
-            mat.form = request.form.get("form")
-            db.commit()
-            flash("Material updated!", "success")
-            return redirect(url_for("admin_dashboard"))
-        return render_template("edit_material.html", mat=mat)
-    finally:
-        db.close()
+    db = get_db()
+    mat = db.query(RevisionMaterial).get(material_id)
+    if request.method == "POST":
+        old_form = mat.form
+        mat.title = request.form.get("title")
+        mat.link = request.form.get("link")
+        mat.form = request.form.get("form")
+        new_form = mat.form
+        db.commit()
+        invalidate_catalog(old_form, new_form)
+        invalidate_material(material_id)
+        flash("Material updated!", "success")
+        return redirect(url_for("admin_dashboard"))
+    return render_template("edit_material.html", mat=mat)
 
 @app.route("/admin/material/delete/<int:material_id>", methods=["POST"])
 @role_required("admin")
 def delete_material(material_id):
-    db = SessionLocal()
-    try:
-        mat = db.query(RevisionMaterial).get(material_id)
-        if not mat:
-            flash("Material not found!", "danger")
-            return redirect(url_for("admin_dashboard"))
-        db.delete(mat)
-        db.commit()
-        flash("Material deleted!", "success")
-    finally:
-        db.close()
+    db = get_db()
+    mat = db.query(RevisionMaterial).get(material_id)
+    if not mat:
+        flash("Material not found!", "danger")
+        return redirect(url_for("admin_dashboard"))
+    old_form = mat.form
+    db.delete(mat)
+    db.commit()
+    invalidate_catalog(old_form)
+    invalidate_material(material_id)
+    flash("Material deleted!", "success")
     return redirect(url_for("admin_dashboard"))
 
 # -----------------------
@@ -591,141 +729,255 @@ def delete_material(material_id):
 @role_required("admin")
 def add_video():
     if request.method == 'POST':
-        db = SessionLocal()
-        try:
-            title = request.form.get('title', '').strip()
-            link = request.form.get('link', '').strip()
-            form_class = request.form.get('form', '').strip()
-            subject = request.form.get('subject', '').strip()
-
-            if not title or not link or not form_class or not subject:
-                flash("All fields are required", "danger")
-                return redirect(url_for('admin_dashboard'))
-
-            if "drive.google.com/file/d/" in link:
-                file_id = link.split("/d/")[1].split("/")[0]
-                link = f"https://drive.google.com/file/d/{file_id}/preview"
-
-            new_video = Video(
-                title=title,
-                link=link,
-                form=form_class,
-                subject=subject
-            )
-            db.add(new_video)
-            db.commit()
-            flash("Video added successfully!", "success")
-        finally:
-            db.close()
+        title = request.form.get('title', '').strip()
+        link = request.form.get('link', '').strip()
+        form_class = request.form.get('form', '').strip()
+        subject = request.form.get('subject', '').strip()
+
+        if not title or not link or not form_class or not subject:
+            flash("All fields are required", "danger")
+            return redirect(url_for('admin_dashboard'))
+
+        db = get_db()
+        new_video = Video(
+            title=title,
+            link=link,
+            form=form_class,
+            subject=subject
+        )
+        db.add(new_video)
+        db.commit()
+        invalidate_catalog(form_class)
+        flash("Video added successfully!", "success")
 
     return redirect(url_for('admin_dashboard'))
 
 @app.route("/admin/video/edit/<int:video_id>", methods=["GET", "POST"])
 @role_required("admin")
 def edit_video(video_id):
-    db = SessionLocal()
-    try:
-        video = db.query(Video).get(video_id)
-        if request.method == "POST":
-            video.title = request.form.get("title")
-            video.link = request.form.get("link")
-            video.form = request.form.get("form")
-            db.commit()
-            flash("Video updated!", "success")
-            return redirect(url_for("admin_dashboard"))
-        return render_template("edit_video.html", video=video)
-    finally:
-        db.close()
+    db = get_db()
+    video = db.query(Video).get(video_id)
+    if request.method == "POST":
+        old_form = video.form
+        video.title = request.form.get("title")
+        video.link = request.form.get("link")
+        video.form = request.form.get("form")
+        new_form = video.form
+        db.commit()
+        invalidate_catalog(old_form, new_form)
+        flash("Video updated!", "success")
+        return redirect(url_for("admin_dashboard"))
+    return render_template("edit_video.html", video=video)
 
 @app.route("/admin/video/delete/<int:video_id>")
 @role_required("admin")
 def delete_video(video_id):
-    db = SessionLocal()
-    try:
-        video = db.query(Video).get(video_id)
-        db.delete(video)
-        db.commit()
-        flash("Video deleted!", "success")
-    finally:
-        db.close()
+    db = get_db()
+    video = db.query(Video).get(video_id)
+    old_form = video.form
+    db.delete(video)
+    db.commit()
+    invalidate_catalog(old_form)
+    flash("Video deleted!", "success")
     return redirect(url_for("admin_dashboard"))
 
+# -----------------------
+# Material downloads
+# -----------------------
+@app.route("/materials/<int:material_id>/file")
+@query_budget(2)  # session version check + material row (both cached when warm)
+@read_only
+def download_material(material_id):
+    if not session.get("user_id"):
+        return redirect(url_for("login"))
+
+    db = get_db()
+    if session.get("role") == "student":
+        account = current_account(db)
+        if not account or not account.get("is_active"):
+            return "Account not active", 403
+
+    material = get_material_file(db, material_id)
+    if material is None:
+        return "Material not found", 404
+    if not material["file_path"]:
+        # Google Drive and other external links
+        return redirect(material["link"])
+
+    # file_path is "materials/<hash>.<ext>"; the file lives in the upload folder
+    path = safe_join(app.config['UPLOAD_FOLDER'], material["file_path"].removeprefix("materials/"))
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    ext = os.path.splitext(path)[1]
+    # Stored under its content hash, so the hash is a strong validator
+    etag = material["file_sha256"]
+
+    if MATERIAL_SENDFILE == "nginx":
+        response = Response(mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream")
+        response.headers["X-Accel-Redirect"] = MATERIAL_ACCEL_PREFIX.rstrip("/") + "/" + material["file_path"]
+        if etag:
+            response.set_etag(etag)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            del response.headers["X-Accel-Redirect"]
+    else:
+        # Werkzeug answers Range, If-Range and If-None-Match (206/304) itself
+        response = send_file(
+            path,
+            download_name=f"{material['title']}{ext}",
+            conditional=True,
+            etag=etag or True,
+            max_age=MATERIAL_MAX_AGE,
+        )
+
+    response.headers["Content-Disposition"] = "inline"
+    # Only for logged-in users: browsers may keep it, shared caches may not
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = MATERIAL_MAX_AGE
+    return response
+
 # -----------------------
 # Manage students (admin)
 # -----------------------
+# Only these columns can be sorted on; each has a (column, id) index for keyset paging
+STUDENT_SORT_COLUMNS = {
+    "id": CompleteProfile.id,
+    "first_name": CompleteProfile.first_name,
+    "last_name": CompleteProfile.last_name,
+    "form": CompleteProfile.form,
+    "contact_no": CompleteProfile.contact_no,
+}
+STUDENT_PAGE_SIZE = 50
+STUDENT_MAX_PAGE_SIZE = 200
+
 @app.route("/admin/manage_students")
 @role_required("admin")
+@query_budget(3)  # one keyset page, or index probe + ranked ids + rows for a search
+@read_only
 def manage_students():
-    db = SessionLocal()
-    try:
-        search_query = request.args.get("search", "").strip().lower()
-        sort_by = request.args.get("sort", "id")
-        sort_order = request.args.get("order", "asc")
-
-        students = db.query(CompleteProfile)
-
-        if search_query:
-            students = students.filter(
-                (func.lower(CompleteProfile.first_name).like(f"%{search_query}%")) |
-                (func.lower(CompleteProfile.last_name).like(f"%{search_query}%")) |
-                (func.lower(CompleteProfile.form).like(f"%{search_query}%")) |
-                (func.lower(CompleteProfile.contact_no).like(f"%{search_query}%"))
-            )
-
-        sort_column = getattr(CompleteProfile, sort_by, CompleteProfile.id)
-        if sort_order == "desc":
-            sort_column = sort_column.desc()
-
-        students = students.order_by(sort_column).all()
+    db = get_db()
+    search_query = request.args.get("search", "").strip().lower()
+    sort_by = request.args.get("sort", "id")
+    if sort_by not in STUDENT_SORT_COLUMNS:
+        sort_by = "id"
+    sort_order = "desc" if request.args.get("order") == "desc" else "asc"
+    per_page = request.args.get("per_page", STUDENT_PAGE_SIZE, type=int)
+    per_page = max(1, min(per_page, STUDENT_MAX_PAGE_SIZE))
+
+    if search_query:
+        # Ranked matches from the search index: one page of best hits, no cursors
+        students = search_students(db, search_query, limit=per_page)
         return render_template("admin/admin_manage_students.html",
-                               students=students, sort_by=sort_by, sort_order=sort_order)
-    finally:
-        db.close()
+                               students=students, sort_by=sort_by, sort_order=sort_order,
+                               search=search_query, per_page=per_page,
+                               next_cursor=None, prev_cursor=None)
+
+    students, next_cursor, prev_cursor = keyset_page(
+        db.query(CompleteProfile),
+        STUDENT_SORT_COLUMNS[sort_by],
+        CompleteProfile.id,
+        descending=(sort_order == "desc"),
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+        limit=per_page,
+    )
+    return render_template("admin/admin_manage_students.html",
+                           students=students, sort_by=sort_by, sort_order=sort_order,
+                           search=search_query, per_page=per_page,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor)
 
 @app.route('/mark_paid/<int:student_id>')
 @role_required("admin")
 def mark_paid(student_id):
-    db = SessionLocal()
+    db = get_db()
     try:
         student = db.query(CompleteProfile).filter_by(id=student_id).first()
         if not student:
             flash("Student not found.", "danger")
             return redirect(url_for("admin_dashboard"))
 
+        was_active = student.is_active
         student.is_active = True
+        student_changed(db, student.form, was_active, student.form, True)
+        bump_session_version(db, student.user_id)
         db.commit()
         flash(f"{student.first_name} {student.last_name} has been activated (paid).", "success")
     except Exception as e:
         db.rollback()
         flash("Error activating student.", "danger")
         print(f"Error: {e}")
-    finally:
-        db.close()
 
     return redirect(url_for("admin_dashboard"))
 
 @app.route('/mark_blocked/<int:student_id>')
 @role_required("admin")
 def mark_blocked(student_id):
-    db = SessionLocal()
+    db = get_db()
     try:
         student = db.query(CompleteProfile).filter_by(id=student_id).first()
         if not student:
             flash("Student not found.", "danger")
             return redirect(url_for("admin_dashboard"))
 
+        was_active = student.is_active
         student.is_active = False
+        student_changed(db, student.form, was_active, student.form, False)
+        bump_session_version(db, student.user_id)
         db.commit()
         flash(f"{student.first_name} {student.last_name} has been blocked.", "warning")
     except Exception as e:
         db.rollback()
         flash("Error blocking student. Please try again.", "danger")
         print(f"Error: {e}")
-    finally:
-        db.close()
 
     return redirect(url_for("admin_dashboard"))
 
+@app.route("/admin/students/bulk_status", methods=["GET", "POST"])
+@role_required("admin")
+def bulk_student_status():
+    """Activate/block many students at once, from selected ids or a payments CSV."""
+    summary = None
+    if request.method == "POST":
+        db = get_db()
+        data = request.get_json(silent=True) or request.form
+        payments_file = request.files.get("payments")
+        try:
+            if payments_file and payments_file.filename:
+                fee = request.form.get("fee", type=float)
+                summary = reconcile_payments(db, read_payments_csv(payments_file),
+                                             fee=TERM_FEE if fee is None else fee)
+            else:
+                action = data.get("action")
+                if action not in ("activate", "block"):
+                    raise PaymentsFileError("Choose activate or block.")
+                if request.is_json:
+                    raw_ids = data.get("student_ids") or []
+                else:
+                    raw_ids = request.form.getlist("student_ids")
+                    raw_ids += request.form.get("student_id_list", "").replace(",", " ").split()
+                try:
+                    student_ids = {int(i) for i in raw_ids}
+                except (TypeError, ValueError):
+                    raise PaymentsFileError("Student ids must be numbers.")
+                summary = set_students_active(db, student_ids, action == "activate")
+            db.commit()
+        except PaymentsFileError as e:
+            db.rollback()
+            if request.is_json:
+                return jsonify({"success": False, "error": str(e)}), 400
+            flash(str(e), "danger")
+        except Exception:
+            db.rollback()
+            app.logger.exception("bulk student status update failed")
+            if request.is_json:
+                return jsonify({"success": False, "error": "Bulk update failed."}), 500
+            flash("Bulk update failed. Nothing was changed.", "danger")
+
+        if summary is not None and request.is_json:
+            return jsonify({"success": True, **summary})
+    return render_template("admin/admin_bulk_students.html", summary=summary, term_fee=TERM_FEE)
+
 # -----------------------
 # AJAX endpoints (admin)
 # -----------------------
@@ -733,7 +985,7 @@ def mark_blocked(student_id):
 @role_required("admin")
 def add_item():
     data = request.json
-    db = SessionLocal()
+    db = get_db()
     try:
         if data["type"] == "live":
             new = LiveClass(
@@ -760,51 +1012,79 @@ def add_item():
             )
         db.add(new)
         db.commit()
+        invalidate_catalog(data.get("form"))
         return jsonify({"success": True, "id": new.id})
     except Exception as e:
         db.rollback()
         return jsonify({"success": False, "error": str(e)}), 500
-    finally:
-        db.close()
 
 @app.route("/api/update_item/<string:item_type>/<int:item_id>", methods=["PUT"])
 @role_required("admin")
 def update_item(item_type, item_id):
     data = request.json
-    db = SessionLocal()
+    db = get_db()
     try:
         model = {"live": LiveClass, "material": RevisionMaterial, "video": Video}.get(item_type)
         item = db.query(model).get(item_id)
         if not item:
             return jsonify({"success": False, "error": "Not found"}), 404
 
+        old_form = item.form
         for k, v in data.items():
             setattr(item, k, v)
+        new_form = item.form
         db.commit()
+        invalidate_catalog(old_form, new_form)
+        if item_type == "material":
+            invalidate_material(item_id)
         return jsonify({"success": True})
     except Exception as e:
         db.rollback()
         return jsonify({"success": False, "error": str(e)}), 500
-    finally:
-        db.close()
 
 @app.route("/api/delete_item/<string:item_type>/<int:item_id>", methods=["DELETE"])
 @role_required("admin")
 def delete_item(item_type, item_id):
-    db = SessionLocal()
+    db = get_db()
     try:
         model = {"live": LiveClass, "material": RevisionMaterial, "video": Video}.get(item_type)
         item = db.query(model).get(item_id)
         if not item:
             return jsonify({"success": False, "error": "Not found"}), 404
+        old_form = item.form
         db.delete(item)
         db.commit()
+        invalidate_catalog(old_form)
+        if item_type == "material":
+            invalidate_material(item_id)
         return jsonify({"success": True})
     except Exception as e:
         db.rollback()
         return jsonify({"success": False, "error": str(e)}), 500
-    finally:
-        db.close()
+
+@app.route("/api/batch", methods=["POST"])
+@role_required("admin")
+def batch_items():
+    """Many create/update/delete ops on live classes, materials and videos in one transaction."""
+    data = request.get_json(silent=True) or {}
+    db = get_db()
+    try:
+        outcome = apply_batch(db, data.get("ops"))
+        if not outcome.ok:
+            db.rollback()
+            return jsonify({"success": False, "results": outcome.results}), 400
+        db.commit()
+    except Exception:
+        db.rollback()
+        # Ops are validated up front; don't echo SQL and parameters back
+        app.logger.exception("batch failed")
+        return jsonify({"success": False, "error": "Database error"}), 500
+
+    if outcome.forms:
+        invalidate_catalog(*outcome.forms)
+    for material_id in outcome.material_ids:
+        invalidate_material(material_id)
+    return jsonify({"success": True, "results": outcome.results})
 
 # -----------------------
 # Teacher CRUD - Live Classes & Materials (single, non-duplicate implementations)
@@ -813,33 +1093,31 @@ def delete_item(item_type, item_id):
 @role_required("teacher")
 def teacher_add_live_class():
     if request.method == "POST":
-        db = SessionLocal()
-        try:
-            title = request.form.get("title", "").strip()
-            link = request.form.get("link", "").strip()
-            time = request.form.get("time", "").strip()
-            form = request.form.get("form", "").strip()
-            subject = request.form.get("subject", "").strip()
-
-            if not title or not link:
-                flash("Title and link are required.", "danger")
-                return redirect(url_for("teacher_dashboard"))
-
-            new_class = LiveClass(
-                title=title,
-                link=link,
-                time=time,
-                form=form,
-                subject=subject
-            )
-            # If you add teacher_id to the LiveClass model, set it here:
-            # new_class.teacher_id = session["user_id"]
+        title = request.form.get("title", "").strip()
+        link = request.form.get("link", "").strip()
+        time = request.form.get("time", "").strip()
+        form = request.form.get("form", "").strip()
+        subject = request.form.get("subject", "").strip()
 
-            db.add(new_class)
-            db.commit()
-            flash("✅ Live class added successfully!", "success")
-        finally:
-            db.close()
+        if not title or not link:
+            flash("Title and link are required.", "danger")
+            return redirect(url_for("teacher_dashboard"))
+
+        db = get_db()
+        new_class = LiveClass(
+            title=title,
+            link=link,
+            time=time,
+            form=form,
+            subject=subject
+        )
+        # If you add teacher_id to the LiveClass model, set it here:
+        # new_class.teacher_id = session["user_id"]
+
+        db.add(new_class)
+        db.commit()
+        invalidate_catalog(form)
+        flash("✅ Live class added successfully!", "success")
         return redirect(url_for("teacher_dashboard"))
 
     return render_template("teachers/add_live_class.html")
@@ -848,44 +1126,40 @@ def teacher_add_live_class():
 @role_required("teacher")
 def teacher_add_material():
     if request.method == "POST":
-        db = SessionLocal()
-        try:
-            title = request.form.get("title", "").strip()
-            subject = request.form.get("subject", "").strip()
-            form_class = request.form.get("form", "").strip()
-            link = request.form.get("link", "").strip()
-            file = request.files.get("file")
-
-            if not title or not subject or not form_class:
-                flash("All fields are required!", "danger")
-                return redirect(url_for("teacher_dashboard"))
-
-            if link:
-                if "drive.google.com/file/d/" in link:
-                    file_id = link.split("/d/")[1].split("/")[0]
-                    link = f"https://drive.google.com/uc?export=download&id={file_id}"
-            elif file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-                file.save(file_path)
-                link = url_for("static", filename=f"materials/{filename}")
-            else:
-                flash("Please upload a valid file or Google Drive link.", "danger")
-                return redirect(url_for("teacher_dashboard"))
-
-            new_material = RevisionMaterial(
-                title=title,
-                subject=subject,
-                form=form_class,
-                link=link
-            )
-            # If adding teacher relationship, set new_material.teacher_id = session["user_id"]
+        title = request.form.get("title", "").strip()
+        subject = request.form.get("subject", "").strip()
+        form_class = request.form.get("form", "").strip()
+        link = request.form.get("link", "").strip()
+        file = request.files.get("file")
+
+        if not title or not subject or not form_class:
+            flash("All fields are required!", "danger")
+            return redirect(url_for("teacher_dashboard"))
 
-            db.add(new_material)
-            db.commit()
-            flash("✅ Material uploaded successfully!", "success")
-        finally:
-            db.close()
+        stored = None
+        # Links are normalized by the model (embed/download URLs)
+        if not link and file and allowed_file(file.filename):
+            stored = store_upload(file, app.config["UPLOAD_FOLDER"])
+        elif not link:
+            flash("Please upload a valid file or Google Drive link.", "danger")
+            return redirect(url_for("teacher_dashboard"))
+
+        db = get_db()
+        new_material = RevisionMaterial(
+            title=title,
+            subject=subject,
+            form=form_class,
+            link=link or None,  # uploads have no public URL, only download_material
+            file_path=f"materials/{stored.name}" if stored else None,
+            file_size=stored.size if stored else None,
+            file_sha256=stored.sha256 if stored else None
+        )
+        # If adding teacher relationship, set new_material.teacher_id = session["user_id"]
+
+        db.add(new_material)
+        db.commit()
+        invalidate_catalog(form_class)
+        flash("✅ Material uploaded successfully!", "success")
         return redirect(url_for("teacher_dashboard"))
 
     return render_template("teachers/add_material.html")
@@ -894,121 +1168,191 @@ def teacher_add_material():
 @app.route("/teacher/live_class/edit/<int:class_id>", methods=["GET", "POST"])
 @role_required("teacher")
 def teacher_edit_live_class(class_id):
-    db = SessionLocal()
-    try:
-        cls = db.query(LiveClass).get(class_id)
-        if request.method == "POST":
-            cls.title = request.form.get("title")
-            cls.link = request.form.get("link")
-            cls.time = request.form.get("time")
-            cls.form = request.form.get("form")
-            cls.subject = request.form.get("subject")
-            db.commit()
-            flash("✅ Live class updated!", "success")
-            return redirect(url_for("teacher_dashboard"))
-        return render_template("edit_live_class.html", cls=cls)
-    finally:
-        db.close()
+    db = get_db()
+    cls = db.query(LiveClass).get(class_id)
+    if request.method == "POST":
+        old_form = cls.form
+        cls.title = request.form.get("title")
+        cls.link = request.form.get("link")
+        cls.time = request.form.get("time")
+        cls.form = request.form.get("form")
+        cls.subject = request.form.get("subject")
+        new_form = cls.form
+        db.commit()
+        invalidate_catalog(old_form, new_form)
+        flash("✅ Live class updated!", "success")
+        return redirect(url_for("teacher_dashboard"))
+    return render_template("edit_live_class.html", cls=cls)
 
 @app.route("/teacher/live_class/delete/<int:class_id>", methods=["POST"])
 @role_required("teacher")
 def teacher_delete_live_class(class_id):
-    db = SessionLocal()
-    try:
-        cls = db.query(LiveClass).get(class_id)
-        if cls:
-            db.delete(cls)
-            db.commit()
-            flash("✅ Live class deleted!", "success")
-        else:
-            flash("Class not found.", "danger")
-    finally:
-        db.close()
+    db = get_db()
+    cls = db.query(LiveClass).get(class_id)
+    if cls:
+        old_form = cls.form
+        db.delete(cls)
+        db.commit()
+        invalidate_catalog(old_form)
+        flash("✅ Live class deleted!", "success")
+    else:
+        flash("Class not found.", "danger")
     return redirect(url_for("teacher_dashboard"))
 
 @app.route("/teacher/material/edit/<int:material_id>", methods=["GET", "POST"])
 @role_required("teacher")
 def teacher_edit_material(material_id):
-    db = SessionLocal()
-    try:
-        mat = db.query(RevisionMaterial).get(material_id)
-        if request.method == "POST":
-            mat.title = request.form.get("title")
-            mat.link = request.form.get("link")
-            mat.form = request.form.get("form")
-            mat.subject = request.form.get("subject")
-            db.commit()
-            flash("Material updated!", "success")
-            return redirect(url_for("teacher_dashboard"))
-        return render_template("edit_material.html", mat=mat)
-    finally:
-        db.close()
+    db = get_db()
+    mat = db.query(RevisionMaterial).get(material_id)
+    if request.method == "POST":
+        old_form = mat.form
+        mat.title = request.form.get("title")
+        mat.link = request.form.get("link")
+        mat.form = request.form.get("form")
+        mat.subject = request.form.get("subject")
+        new_form = mat.form
+        db.commit()
+        invalidate_catalog(old_form, new_form)
+        invalidate_material(material_id)
+        flash("Material updated!", "success")
+        return redirect(url_for("teacher_dashboard"))
+    return render_template("edit_material.html", mat=mat)
 
 @app.route("/teacher/material/delete/<int:material_id>", methods=["POST"])
 @role_required("teacher")
 def teacher_delete_material(material_id):
-    db = SessionLocal()
-    try:
-        mat = db.query(RevisionMaterial).get(material_id)
-        if mat:
-            db.delete(mat)
-            db.commit()
-            flash("Material deleted!", "success")
-        else:
-            flash("Material not found.", "danger")
-    finally:
-        db.close()
+    db = get_db()
+    mat = db.query(RevisionMaterial).get(material_id)
+    if mat:
+        old_form = mat.form
+        db.delete(mat)
+        db.commit()
+        invalidate_catalog(old_form)
+        invalidate_material(material_id)
+        flash("Material deleted!", "success")
+    else:
+        flash("Material not found.", "danger")
     return redirect(url_for("teacher_dashboard"))
 
 
 
+# -----------------------
+# Bulk account import (admin)
+# -----------------------
+@app.route("/admin/import_accounts", methods=["GET", "POST"])
+@role_required("admin")
+def import_accounts():
+    if request.method == "POST":
+        file = request.files.get("accounts")
+        default_role = request.form.get("default_role", "student")
+        if not file or not file.filename:
+            flash("Choose a CSV file to import.", "danger")
+        elif default_role not in ROLES:
+            flash("Invalid default role.", "danger")
+        else:
+            try:
+                job_id = start_import(file, app.instance_path, default_role)
+                return redirect(url_for("import_accounts", job=job_id))
+            except ImportFileError as e:
+                flash(str(e), "danger")
+    return render_template("admin/admin_import_accounts.html", job_id=request.args.get("job"))
+
+@app.route("/admin/import_accounts/<job_id>/status")
+@role_required("admin")
+def import_accounts_status(job_id):
+    progress = read_progress(import_folder(app.instance_path), job_id)
+    if progress is None:
+        return jsonify({"success": False, "error": "Not found"}), 404
+    return jsonify(progress)
+
 # -----------------------
 # Manage teachers (admin)
 # -----------------------
 @app.route("/admin/manage_teachers")
 @role_required("admin")
+@query_budget(1)  # the template must not touch teacher.user (one lazy load per row)
+@read_only
 def manage_teachers():
-    db = SessionLocal()
-    try:
-        teachers = db.query(Teacher).all()
-        return render_template("admin/admin_manage_teachers.html", teachers=teachers)
-    finally:
-        db.close()
+    db = get_db()
+    teachers = db.query(Teacher).all()
+    return render_template("admin/admin_manage_teachers.html", teachers=teachers)
 
 @app.route("/admin/approve_teacher/<int:teacher_id>")
 @role_required("admin")
 def approve_teacher(teacher_id):
-    db = SessionLocal()
-    try:
-        teacher = db.query(Teacher).filter_by(id=teacher_id).first()
-        if not teacher:
-            flash("Teacher not found.", "danger")
-            return redirect(url_for("manage_teachers"))
-
-        teacher.is_approved = True
-        db.commit()
-        flash(f"{teacher.teacher_name} has been approved!", "success")
-    finally:
-        db.close()
+    db = get_db()
+    teacher = db.query(Teacher).filter_by(id=teacher_id).first()
+    if not teacher:
+        flash("Teacher not found.", "danger")
+        return redirect(url_for("manage_teachers"))
+
+    was_approved = teacher.is_approved
+    teacher.is_approved = True
+    teacher_changed(db, was_approved, True)
+    bump_session_version(db, teacher.user_id)
+    db.commit()
+    flash(f"{teacher.teacher_name} has been approved!", "success")
     return redirect(url_for("manage_teachers"))
 
 @app.route("/admin/block_teacher/<int:teacher_id>")
 @role_required("admin")
 def block_teacher(teacher_id):
-    db = SessionLocal()
-    try:
-        teacher = db.query(Teacher).filter_by(id=teacher_id).first()
-        if not teacher:
-            flash("Teacher not found.", "danger")
-            return redirect(url_for("manage_teachers"))
-
-        teacher.is_approved = False
-        db.commit()
-        flash(f"{teacher.teacher_name} has been blocked.", "warning")
-    finally:
-        db.close()
+    db = get_db()
+    teacher = db.query(Teacher).filter_by(id=teacher_id).first()
+    if not teacher:
+        flash("Teacher not found.", "danger")
+        return redirect(url_for("manage_teachers"))
+
+    was_approved = teacher.is_approved
+    teacher.is_approved = False
+    teacher_changed(db, was_approved, False)
+    bump_session_version(db, teacher.user_id)
+    db.commit()
+    flash(f"{teacher.teacher_name} has been blocked.", "warning")
     return redirect(url_for("manage_teachers"))
 
+# -----------------------
+# Metrics (Prometheus text format)
+# -----------------------
+def metrics_allowed():
+    """Admin session, or the METRICS_TOKEN bearer token."""
+    authorization = request.headers.get("Authorization", "")
+    token_ok = bool(METRICS_TOKEN) and hmac.compare_digest(authorization, f"Bearer {METRICS_TOKEN}")
+    return token_ok or session.get("role") == "admin"
+
+
+@app.route("/metrics")
+def metrics():
+    if not metrics_allowed():
+        return Response("Forbidden\n", status=403, mimetype="text/plain")
+    return Response(render_metrics(app), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/admin/profiles/<name>")
+@role_required("admin")
+def download_profile(name):
+    """Collapsed stacks saved by the request profiler (flamegraph.pl / speedscope input)."""
+    return send_from_directory(profile_folder(app.instance_path), name, mimetype="text/plain")
+
+
+QUERY_STATS_SORTS = {"total": "total_ms", "mean": "mean_ms", "p95": "p95_ms", "max": "max_ms",
+                     "calls": "calls", "rows": "rows"}
+
+
+@app.route("/metrics/queries", methods=["GET", "POST"])
+def query_statistics():
+    """Statement fingerprints by total time (?sort=mean|p95|calls|..., ?format=json); POST resets."""
+    if not metrics_allowed():
+        return Response("Forbidden\n", status=403, mimetype="text/plain")
+    if request.method == "POST":
+        reset_query_stats()
+        return Response("reset\n", mimetype="text/plain")
+    sort = QUERY_STATS_SORTS.get(request.args.get("sort", "total"), "total_ms")
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    if request.args.get("format") == "json":
+        return jsonify([dict(stats, statement=statement) for statement, stats in query_stats(sort, limit)])
+    return Response(render_query_stats(sort, limit), mimetype="text/plain")
+
 
 # -----------------------
 # Run
@@ -0,0 +1,206 @@
+# batch.py
+import os
+from collections import namedtuple
+
+from sqlalchemy import Boolean, delete, insert, select, update
+
+from content_versions import bump_content_versions
+from live_events import NEW_EVENTS, content_event, queue_events
+from links import link_columns
+from models import LiveClass, RevisionMaterial, Video, normalize_form
+
+# =========================
+# Batched content operations (/api/batch)
+# =========================
+# A batch is a list of ops:
+#   {"op": "create", "type": "live", "data": {...}}
+#   {"op": "update", "type": "video", "id": 7, "data": {...}}
+#   {"op": "delete", "type": "material", "id": 3}
+# Every op is validated (and every update/delete target looked up, in one
+# query per type) before anything is written. Then creates, updates and
+# deletes run as one executemany/IN statement per type in the caller's
+# transaction, so the batch commits or fails as a whole.
+
+BATCH_MAX_OPS = int(os.environ.get("BATCH_MAX_OPS", "500"))
+
+MODELS = {"live": LiveClass, "material": RevisionMaterial, "video": Video}
+
+# Columns an op may write, with the value a create gets when it leaves one out.
+# file_path/file_size/file_sha256 only come from the upload routes.
+WRITABLE_COLUMNS = {
+    "live": {"title": None, "link": None, "time": None, "form": None, "subject": None, "active": False},
+    "material": {"title": None, "link": None, "form": None, "subject": None},
+    "video": {"title": None, "link": None, "form": None, "subject": None},
+}
+# Types whose models derive link_provider/embed_url/... from `link`
+LINKED_TYPES = ("material", "video")
+REQUIRED_COLUMNS = {
+    "live": ("title", "link"),
+    "material": ("title",),
+    "video": ("title", "link"),
+}
+
+BatchResult = namedtuple("BatchResult", "ok results forms material_ids")
+
+
+def _check_values(model, data):
+    """Error message for a value the column can't take, or None (checked before any SQL runs)."""
+    for name, value in data.items():
+        column_type = model.__table__.c[name].type
+        if isinstance(column_type, Boolean):
+            if not isinstance(value, bool):
+                return f"{name} must be true or false"
+        elif value is not None and not isinstance(value, str):
+            return f"{name} must be a string or null"
+        elif value is not None and column_type.length and len(value) > column_type.length:
+            return f"{name} is longer than {column_type.length} characters"
+    return None
+
+
+def _check_op(op):
+    """Error message for a malformed op, or None."""
+    if not isinstance(op, dict):
+        return "op must be an object"
+    kind = op.get("op")
+    if kind not in ("create", "update", "delete"):
+        return "op must be create, update or delete"
+    item_type = op.get("type")
+    if item_type not in MODELS:
+        return f"unknown type {item_type!r}"
+    if kind != "create" and (not isinstance(op.get("id"), int) or isinstance(op.get("id"), bool)):
+        return "id must be an integer"
+    if kind == "delete":
+        return None
+
+    data = op.get("data")
+    if not isinstance(data, dict) or not data:
+        return "data must be a non-empty object"
+    unknown = sorted(set(data) - set(WRITABLE_COLUMNS[item_type]))
+    if unknown:
+        return f"columns not allowed: {', '.join(unknown)}"
+    error = _check_values(MODELS[item_type], data)
+    if error:
+        return error
+    required = REQUIRED_COLUMNS[item_type]
+    if kind == "create":
+        missing = [c for c in required if not data.get(c)]
+    else:
+        missing = [c for c in required if c in data and not data[c]]
+    if missing:
+        return f"required: {', '.join(missing)}"
+    return None
+
+
+def _row_values(item_type, data, create):
+    if create:
+        # executemany needs the same keys on every row
+        values = {col: data.get(col, default) for col, default in WRITABLE_COLUMNS[item_type].items()}
+    else:
+        values = dict(data)
+    # Core statements skip @validates, so the derived columns are filled in here
+    if "form" in values:
+        values["form_key"] = normalize_form(values["form"])
+    if "link" in values and item_type in LINKED_TYPES:
+        values.update(link_columns(values["link"]))
+    return values
+
+
+def apply_batch(db, ops):
+    """Validate and apply `ops` inside `db`'s transaction (the caller commits).
+
+    Nothing is written unless every op is valid; `results` has one entry per op
+    either way. `forms` and `material_ids` are what the caller should invalidate.
+    """
+    if not isinstance(ops, list) or not ops:
+        return BatchResult(False, [{"success": False, "error": "ops must be a non-empty list"}], set(), set())
+    if len(ops) > BATCH_MAX_OPS:
+        return BatchResult(False, [{"success": False, "error": f"at most {BATCH_MAX_OPS} ops per batch"}],
+                           set(), set())
+
+    results = [{"success": True} for _ in ops]
+    targets = {item_type: {} for item_type in MODELS}  # type -> {id: op index}
+    for index, op in enumerate(ops):
+        error = _check_op(op)
+        if error is None and op["op"] != "create":
+            seen = targets[op["type"]]
+            if op["id"] in seen:
+                error = f"{op['type']} {op['id']} is already targeted by op {seen[op['id']]}"
+            else:
+                seen[op["id"]] = index
+        if error:
+            results[index] = {"success": False, "error": error}
+
+    # One lookup per type: existence check + old forms for cache invalidation
+    forms = set()
+    changes = set()  # (form, section) pairs for content_versions
+    existing = {}  # (type, id) -> (form, title) before the batch
+    for item_type, ids in targets.items():
+        if not ids:
+            continue
+        model = MODELS[item_type]
+        found = {row.id: row for row in db.execute(
+            select(model.id, model.form, model.title).where(model.id.in_(ids))).all()}
+        for item_id, index in ids.items():
+            if item_id not in found:
+                results[index] = {"success": False, "error": "Not found"}
+            else:
+                existing[(item_type, item_id)] = (found[item_id].form, found[item_id].title)
+                forms.add(found[item_id].form)
+                changes.add((found[item_id].form, model.content_section))
+
+    if not all(r["success"] for r in results):
+        return BatchResult(False, results, set(), set())
+
+    material_ids = set()
+    messages = []
+    for item_type, model in MODELS.items():
+        mine = [(i, op) for i, op in enumerate(ops) if op["type"] == item_type]
+
+        creates = [(i, op) for i, op in mine if op["op"] == "create"]
+        if creates:
+            rows = [_row_values(item_type, op["data"], create=True) for _, op in creates]
+            new_ids = db.execute(
+                insert(model).returning(model.id, sort_by_parameter_order=True), rows
+            ).scalars().all()
+            for (index, op), new_id in zip(creates, new_ids):
+                results[index]["id"] = new_id
+                forms.add(op["data"].get("form"))
+                changes.add((op["data"].get("form"), model.content_section))
+                messages.append(content_event(NEW_EVENTS[model.content_section], model.content_section,
+                                              op["data"].get("form"), new_id, op["data"].get("title")))
+                if item_type == "live" and op["data"].get("active"):
+                    messages.append(content_event("class_started", model.content_section,
+                                                  op["data"].get("form"), new_id, op["data"].get("title")))
+
+        updates = [(i, op) for i, op in mine if op["op"] == "update"]
+        if updates:
+            # ORM bulk UPDATE by primary key: grouped into one executemany per key set
+            db.execute(
+                update(model),
+                [dict(_row_values(item_type, op["data"], create=False), id=op["id"]) for _, op in updates],
+            )
+            for index, op in updates:
+                results[index]["id"] = op["id"]
+                if "form" in op["data"]:
+                    forms.add(op["data"]["form"])
+                    changes.add((op["data"]["form"], model.content_section))
+                if item_type == "live" and op["data"].get("active"):
+                    old_form, old_title = existing[(item_type, op["id"])]
+                    messages.append(content_event("class_started", model.content_section,
+                                                  op["data"].get("form", old_form), op["id"],
+                                                  op["data"].get("title", old_title)))
+
+        deletes = [op["id"] for _, op in mine if op["op"] == "delete"]
+        if deletes:
+            db.execute(delete(model).where(model.id.in_(deletes)), execution_options={"synchronize_session": False})
+            for index, op in mine:
+                if op["op"] == "delete":
+                    results[index]["id"] = op["id"]
+
+        if item_type == "material":
+            material_ids.update(op["id"] for _, op in mine if op["op"] != "create")
+
+    # Core statements don't go through the before_flush / after_flush hooks
+    bump_content_versions(db, changes)
+    queue_events(db, messages)
+    return BatchResult(True, results, forms, material_ids)
@@ -0,0 +1,2 @@
+# bench: benchmarks and load tests for the e-learning app.
+# Run modules with `python -m bench.<name> --help` from the repo root.
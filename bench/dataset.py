@@ -0,0 +1,249 @@
+# bench/dataset.py
+# Synthetic school for load tests: students across Forms 1-4, teachers, live
+# classes, revision materials (links and uploaded files) and videos, written
+# with bulk inserts (COPY on Postgres) into the database at DATABASE_URL.
+# --reset only runs against SQLite or a local database whose name contains "bench".
+#
+#   python -m bench.dataset --reset
+#   python -m bench.dataset --reset --students 50000 --teachers 500
+#
+# Every account is named bench-<role>-<n> and shares the password BENCH_PASSWORD.
+# Roughly one student in ten is left blocked (unpaid).
+import argparse
+import csv
+import hashlib
+import io
+import os
+import random
+import time
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from connections import Base, engine
+from content_versions import SECTIONS, bump_content_versions
+from links import link_columns
+from models import (ALL_FORMS, CompleteProfile, LiveClass, RevisionMaterial, Teacher, User, Video,
+                    normalize_form)
+from passwords import make_password_hash
+from search import install_search_index
+from stats import rebuild_stats
+
+BENCH_PASSWORD = "bench-pass"
+# --reset drops every table: only SQLite files and bench databases on these hosts
+# (None: a local Unix socket)
+LOCAL_HOSTS = {None, "", "localhost", "127.0.0.1", "::1"}
+ADMIN_USERNAME = "bench-admin"
+FORMS = ("Form 1", "Form 2", "Form 3", "Form 4")
+SUBJECTS = ("Mathematics", "English", "Kiswahili", "Biology", "Chemistry", "Physics",
+            "History", "Geography", "CRE", "Business Studies", "Agriculture", "Computer Studies")
+FIRST_NAMES = ("Amina", "Brian", "Cynthia", "Dennis", "Esther", "Faith", "George", "Halima", "Ian",
+               "Joy", "Kevin", "Lilian", "Mercy", "Nelson", "Otieno", "Purity", "Quincy", "Ruth",
+               "Samuel", "Tabitha", "Umar", "Violet", "Wanjiru", "Xavier", "Yusuf", "Zawadi")
+LAST_NAMES = ("Achieng", "Barasa", "Chebet", "Njoroge", "Kamau", "Kiprono", "Mutua", "Mwangi",
+              "Ndungu", "Ochieng", "Odhiambo", "Omondi", "Onyango", "Otieno", "Wafula", "Wambui",
+              "Wanjala", "Were", "Kariuki", "Maina")
+# Uploaded-material stand-ins, stored under static/materials/bench/ (sizes in KiB)
+MATERIAL_FILE_SIZES = (64, 256, 1024, 4096)
+MATERIAL_FILE_FOLDER = os.path.join("materials", "bench")
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+
+CHUNK_SIZE = 5000
+
+
+def _copy_rows(conn, table, columns, rows):
+    """COPY ... FROM STDIN through the psycopg2 connection under `conn`."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["\\N" if row[c] is None else row[c] for c in columns])
+    buffer.seek(0)
+    cursor = conn.connection.dbapi_connection.cursor()
+    cursor.copy_expert(
+        f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+    cursor.close()
+
+
+def bulk_insert(conn, model, rows):
+    """Insert dicts into `model`'s table: COPY on Postgres, chunked executemany elsewhere."""
+    table = model.__table__
+    if not rows:
+        return
+    if conn.dialect.name == "postgresql":
+        _copy_rows(conn, table, list(rows[0]), rows)
+        return
+    for start in range(0, len(rows), CHUNK_SIZE):
+        conn.execute(insert(table), rows[start:start + CHUNK_SIZE])
+
+
+def _user_ids(conn, prefix):
+    rows = conn.execute(select(User.id, User.username).where(User.username.like(f"{prefix}%"))).all()
+    return {username: user_id for user_id, username in rows}
+
+
+def _material_files():
+    """Write the stand-in files once; [(file_path relative to static/, size, sha256)]."""
+    folder = os.path.join(STATIC_FOLDER, MATERIAL_FILE_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    files = []
+    for size_kib in MATERIAL_FILE_SIZES:
+        data = random.Random(size_kib).randbytes(size_kib * 1024)
+        digest = hashlib.sha256(data).hexdigest()
+        name = os.path.join(MATERIAL_FILE_FOLDER, f"{digest}.pdf")
+        path = os.path.join(STATIC_FOLDER, name)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(data)
+        files.append((name.replace(os.sep, "/"), len(data), digest))
+    return files
+
+
+def _form(rng):
+    # A little content is aimed at every form
+    return rng.choice(FORMS) if rng.random() > 0.1 else ALL_FORMS
+
+
+def generate(students, teachers, live_classes, materials, videos, seed=1):
+    rng = random.Random(seed)
+    password = make_password_hash(BENCH_PASSWORD)
+    timings = {}
+
+    def timed(name, fn):
+        started = time.perf_counter()
+        fn()
+        timings[name] = time.perf_counter() - started
+
+    with engine.begin() as conn:
+        def users():
+            rows = [{"username": ADMIN_USERNAME, "password": password, "role": "admin", "session_version": 1}]
+            rows += [{"username": f"bench-student-{n:06d}", "password": password, "role": "student",
+                      "session_version": 1} for n in range(1, students + 1)]
+            rows += [{"username": f"bench-teacher-{n:05d}", "password": password, "role": "teacher",
+                      "session_version": 1} for n in range(1, teachers + 1)]
+            bulk_insert(conn, User, rows)
+
+        def profiles():
+            ids = _user_ids(conn, "bench-student-")
+            rows = []
+            for n in range(1, students + 1):
+                rows.append({
+                    "user_id": ids[f"bench-student-{n:06d}"],
+                    "first_name": rng.choice(FIRST_NAMES),
+                    "middle_name": rng.choice(FIRST_NAMES) if rng.random() < 0.5 else None,
+                    "last_name": rng.choice(LAST_NAMES),
+                    "contact_no": f"07{n:08d}",
+                    "guardian_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    "form": FORMS[n % len(FORMS)],
+                    "is_active": n % 10 != 0,
+                })
+            bulk_insert(conn, CompleteProfile, rows)
+
+        def teacher_rows():
+            ids = _user_ids(conn, "bench-teacher-")
+            bulk_insert(conn, Teacher, [{
+                "user_id": ids[f"bench-teacher-{n:05d}"],
+                "teacher_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "phone_number": f"01{n:08d}",
+                "subject": rng.choice(SUBJECTS),
+                "is_approved": n % 5 != 0,
+            } for n in range(1, teachers + 1)])
+
+        def content():
+            rows = []
+            for n in range(1, live_classes + 1):
+                form = _form(rng)
+                rows.append({"title": f"Live class {n}", "link": f"https://meet.example.com/class-{n}",
+                             "time": f"{rng.randint(8, 17):02d}:00", "form": form, "form_key": normalize_form(form),
+                             "subject": rng.choice(SUBJECTS), "active": rng.random() < 0.05})
+            bulk_insert(conn, LiveClass, rows)
+
+            files = _material_files()
+            rows = []
+            for n in range(1, materials + 1):
+                form = _form(rng)
+                row = {"title": f"Revision notes {n}", "subject": rng.choice(SUBJECTS), "form": form,
+                       "form_key": normalize_form(form), "file_path": None, "file_size": None, "file_sha256": None}
+                if n % 4 == 0:
+                    file_path, size, digest = files[n % len(files)]
+                    row.update(link=None, file_path=file_path, file_size=size,
+                               file_sha256=digest)
+                else:
+                    row["link"] = f"https://drive.google.com/file/d/bench{n:07d}/view?usp=sharing"
+                row.update(link_columns(row["link"]))
+                rows.append(row)
+            bulk_insert(conn, RevisionMaterial, rows)
+
+            rows = []
+            for n in range(1, videos + 1):
+                form = _form(rng)
+                link = f"https://www.youtube.com/watch?v=bench{n:06d}"
+                rows.append({"title": f"Lesson video {n}", "link": link, "form": form, "form_key": normalize_form(form),
+                             "subject": rng.choice(SUBJECTS), **link_columns(link)})
+            bulk_insert(conn, Video, rows)
+
+        timed("users", users)
+        timed("profiles", profiles)
+        timed("teachers", teacher_rows)
+        timed("content", content)
+
+        # Counters and content versions are normally kept by the write routes
+        def bookkeeping():
+            rebuild_stats(conn)
+            with Session(bind=conn) as db:
+                bump_content_versions(db, [(form, section) for form in FORMS + (ALL_FORMS,) for section in SECTIONS])
+                db.flush()
+        timed("stats", bookkeeping)
+    return timings
+
+
+def reset_refusal(url):
+    """Why reset_schema() won't drop the database at `url`, or None when it may."""
+    if url.get_backend_name() == "sqlite":
+        return None
+    if url.host not in LOCAL_HOSTS:
+        return f"{url.host} is not a local database server"
+    if "bench" not in (url.database or ""):
+        return f"database {url.database!r} is not a bench database (its name must contain 'bench')"
+    return None
+
+
+def reset_schema():
+    """Drop and recreate every table; only for SQLite files and local bench databases."""
+    refusal = reset_refusal(engine.url)
+    if refusal:
+        raise RuntimeError(f"refusing to reset {engine.url!r}: {refusal}")
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        install_search_index(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic school for load tests")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate every table first (like create.py)")
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--teachers", type=int, default=300)
+    parser.add_argument("--live-classes", type=int, default=2000)
+    parser.add_argument("--materials", type=int, default=3000)
+    parser.add_argument("--videos", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.reset:
+        refusal = reset_refusal(engine.url)
+        if refusal:
+            parser.error(f"refusing to reset: {refusal}")
+        reset_schema()
+    else:
+        with engine.connect() as conn:
+            if _user_ids(conn, ADMIN_USERNAME):
+                parser.error("bench data already present; use --reset to start over")
+
+    timings = generate(args.students, args.teachers, args.live_classes, args.materials, args.videos, args.seed)
+    for name, seconds in timings.items():
+        print(f"{name:<10}{seconds:>8.2f}s")
+    print(f"Log in as {ADMIN_USERNAME} / bench-student-000001 / bench-teacher-00001 with password {BENCH_PASSWORD!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+# bench/load.py
+# Drives the app through the main scenarios and reports throughput and
+# p50/p95/p99 latency per scenario. Run bench.dataset first.
+#
+#   python -m bench.load                               # in-process (Flask test client)
+#   python -m bench.load --gunicorn 4                  # spawn `gunicorn -w 4 app:app` on a free port
+#   python -m bench.load --url http://127.0.0.1:8000   # an already running server
+#   python -m bench.load --save-baseline               # store the numbers in bench/baseline.json
+#   python -m bench.load --compare                     # exit 1 if slower than bench/baseline.json
+#
+# The database is the one at DATABASE_URL for every mode (a spawned gunicorn
+# inherits the environment), so it must be a real file/server database.
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+from sqlalchemy import select
+
+from bench.dataset import ADMIN_USERNAME, BENCH_PASSWORD, FIRST_NAMES, LAST_NAMES
+from connections import engine
+from models import CompleteProfile, RevisionMaterial, User
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "bench", "baseline.json")
+SCENARIOS = ("login", "student_dashboard", "admin_dashboard", "manage_students_search", "material_download")
+
+
+# -----------------------
+# Clients
+# -----------------------
+class InProcessClient:
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def get(self, path):
+        response = self._client.get(path)
+        response.close()
+        return response.status_code
+
+    def post(self, path, data):
+        response = self._client.post(path, data=data)
+        response.close()
+        return response.status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A redirect is the response being measured (e.g. after login), not something to follow
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect)
+
+    def _open(self, request):
+        try:
+            with self._opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data):
+        return self._open(urllib.request.Request(self.base_url + path, data=urllib.parse.urlencode(data).encode()))
+
+
+# -----------------------
+# Scenarios
+# -----------------------
+def load_targets():
+    """Accounts and ids the scenarios pick from, read from the bench dataset."""
+    with engine.connect() as conn:
+        students = conn.execute(
+            select(User.username).join(CompleteProfile, CompleteProfile.user_id == User.id)
+            .where(User.username.like("bench-student-%"), CompleteProfile.is_active.is_(True))
+            .order_by(User.id).limit(500)
+        ).scalars().all()
+        materials = conn.execute(
+            select(RevisionMaterial.id).where(RevisionMaterial.file_path.is_not(None)).limit(500)
+        ).scalars().all()
+    if not students:
+        sys.exit("No bench data found: run `python -m bench.dataset --reset` first")
+    return {"students": students, "materials": materials}
+
+
+def _login(client, username):
+    return client.post("/login", {"username": username, "password": BENCH_PASSWORD})
+
+
+class Worker:
+    """One simulated user: a logged-in client per role, reused across requests."""
+
+    def __init__(self, make_client, targets, rng):
+        self.make_client = make_client
+        self.targets = targets
+        self.rng = rng
+        self.student = make_client()
+        _login(self.student, rng.choice(targets["students"]))
+        self.admin = make_client()
+        _login(self.admin, ADMIN_USERNAME)
+
+    def run(self, scenario):
+        if scenario == "login":
+            return _login(self.make_client(), self.rng.choice(self.targets["students"])), (302,)
+        if scenario == "student_dashboard":
+            return self.student.get("/student"), (200,)
+        if scenario == "admin_dashboard":
+            return self.admin.get("/admin"), (200,)
+        if scenario == "manage_students_search":
+            term = self.rng.choice(FIRST_NAMES + LAST_NAMES)[:self.rng.randint(3, 6)]
+            return self.admin.get(f"/admin/manage_students?search={urllib.parse.quote(term)}"), (200,)
+        if scenario == "material_download":
+            if not self.targets["materials"]:
+                return None, ()
+            return self.student.get(f"/materials/{self.rng.choice(self.targets['materials'])}/file"), (200,)
+        raise ValueError(scenario)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_scenario(workers, scenario, requests):
+    """Spread `requests` requests over the workers (one thread each); latency stats in ms."""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def loop(worker):
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            status, expected = worker.run(scenario)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status is None:
+                    return
+                latencies.append(elapsed)
+                if status not in expected:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=loop, args=(w,)) for w in workers]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+# -----------------------
+# gunicorn
+# -----------------------
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workers):
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"],
+        cwd=ROOT,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            sys.exit("gunicorn exited during startup")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit("gunicorn did not start listening within 30s")
+
+
+# -----------------------
+# Baseline
+# -----------------------
+def compare(results, baseline, tolerance):
+    """Lines describing regressions against `baseline` (p95 up or throughput down by more than `tolerance`)."""
+    regressions = []
+    for scenario, now in results.items():
+        before = baseline.get("scenarios", {}).get(scenario)
+        if not before:
+            continue
+        if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {before['p95_ms']:.1f} -> {now['p95_ms']:.1f} ms")
+        if before["rps"] and now["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{scenario}: throughput {before['rps']:.1f} -> {now['rps']:.1f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the app against the bench dataset")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="base URL of a running server (default: in-process test client)")
+    target.add_argument("--gunicorn", type=int, metavar="WORKERS", help="spawn gunicorn with this many workers")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="simulated users (threads)")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save-baseline", nargs="?", const=BASELINE_PATH, metavar="PATH")
+    parser.add_argument("--compare", nargs="?", const=BASELINE_PATH, metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs. the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    targets = load_targets()
+    server = None
+    if args.gunicorn:
+        server, args.url = start_gunicorn(args.gunicorn)
+    if args.url:
+        mode = f"http ({'gunicorn -w ' + str(args.gunicorn) if args.gunicorn else args.url})"
+        make_client = lambda: HttpClient(args.url)
+    else:
+        from app import app
+        mode = "in-process"
+        make_client = lambda: InProcessClient(app)
+
+    try:
+        rng = random.Random(args.seed)
+        workers = [Worker(make_client, targets, random.Random(rng.random())) for _ in range(args.concurrency)]
+        results = {}
+        for scenario in args.scenarios:
+            if args.warmup:
+                run_scenario(workers, scenario, args.warmup)
+            results[scenario] = run_scenario(workers, scenario, args.requests)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"{mode}, {args.concurrency} users, {engine.dialect.name}")
+    print(f"{'scenario':<24}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for scenario, r in results.items():
+        print(f"{scenario:<24}{r['requests']:>9}{r['errors']:>8}{r['rps']:>9.1f}"
+              f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            scenarios = {name: {k: round(v, 2) for k, v in r.items()} for name, r in results.items()}
+            json.dump({"mode": mode, "concurrency": args.concurrency, "dialect": engine.dialect.name,
+                       "scenarios": scenarios}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if (baseline.get("mode"), baseline.get("concurrency")) != (mode, args.concurrency):
+            print(f"Note: baseline was measured with {baseline.get('mode')}, {baseline.get('concurrency')} users")
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# bench/passwords.py
+# Logins/sec per core for each password hash setting.
+#
+#   python -m bench.passwords
+#   python -m bench.passwords --methods scrypt:16384:8:1 pbkdf2:sha256:600000 --seconds 5
+import argparse
+import os
+import time
+from multiprocessing import Pool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHODS = [
+    "pbkdf2:sha256:600000",
+    "pbkdf2:sha256:1000000",
+    "scrypt:16384:8:1",
+    "scrypt:32768:8:1",
+    "scrypt:65536:8:1",
+]
+
+
+def _verify_for(args):
+    stored, seconds = args
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        check_password_hash(stored, "correct horse battery staple")
+        done += 1
+    return done
+
+
+def measure(method, seconds, processes):
+    stored = generate_password_hash("correct horse battery staple", method=method)
+    # Single core: latency of one login
+    single = _verify_for((stored, seconds)) / seconds
+    # All cores: aggregate throughput, reported per core
+    with Pool(processes) as pool:
+        total = sum(pool.map(_verify_for, [(stored, seconds)] * processes))
+    return single, total / seconds / processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Password hash cost vs. login throughput")
+    parser.add_argument("--methods", nargs="+", default=DEFAULT_METHODS)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    print(f"{'method':<26}{'ms/login':>10}{'logins/s (1 core)':>20}{'logins/s/core (' + str(args.processes) + ' procs)':>28}")
+    for method in args.methods:
+        single, per_core = measure(method, args.seconds, args.processes)
+        print(f"{method:<26}{1000 / single:>10.1f}{single:>20.1f}{per_core:>28.1f}")
+
+
+if __name__ == "__main__":
+    main()
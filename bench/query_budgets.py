@@ -0,0 +1,236 @@
+# bench/query_budgets.py
+# Query-count regression check for every read-only page.
+#
+# Seeds a scratch database twice (a small school and one --scale times
+# bigger), requests each route cold (caches cleared) at both sizes and
+# counts SQL statements and rows fetched. A route fails when it
+#   - runs more statements than its @query_budget (metrics.py), or
+#   - runs more statements on the bigger dataset (an N+1 / per-row query).
+# Rows fetched growing with the dataset (an unbounded list) is reported as a
+# warning, or a failure with --strict-rows.
+#
+#   python -m bench.query_budgets                          # scratch SQLite file
+#   python -m bench.query_budgets --database-url postgresql://localhost/bench_budgets
+#
+# The database at --database-url is dropped and recreated: never point it at real data
+# (bench.dataset.reset_schema refuses anything but SQLite or a local "bench" database).
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+# Requested with the role in the first column; {placeholders} come from _path_ids()
+ROUTES = [
+    ("home", None, "/"),
+    ("login", None, "/login"),
+    ("register", None, "/register"),
+    ("forgot_password", None, "/forgot_password"),
+    ("student_dashboard", "student", "/student"),
+    ("student_content", "student", "/api/student/content"),
+    ("student_events", "student", "/api/student/events"),  # closed right after the headers
+    ("download_material", "student", "/materials/{material_id}/file"),
+    ("teacher_dashboard", "teacher", "/teacher_dashboard"),
+    ("admin_dashboard", "admin", "/admin"),
+    ("manage_students", "admin", "/admin/manage_students"),
+    ("manage_students", "admin", "/admin/manage_students?search=ama"),
+    ("manage_teachers", "admin", "/admin/manage_teachers"),
+    ("bulk_student_status", "admin", "/admin/students/bulk_status"),
+    ("import_accounts", "admin", "/admin/import_accounts"),
+    ("metrics", "admin", "/metrics"),
+    ("query_statistics", "admin", "/metrics/queries"),
+]
+
+# GET routes that are left out on purpose
+SKIPPED = {
+    "static": "static files",
+    "logout": "ends the session",
+    "add_live_class": "GET only flashes and redirects (the form POSTs)",
+    "approve_teacher": "changes state", "block_teacher": "changes state",
+    "mark_paid": "changes state", "mark_blocked": "changes state", "delete_video": "changes state",
+    "complete_profile": "profile form, only before a profile exists",
+    "complete_teacher_profile": "profile form, only before a profile exists",
+    "reset_password": "password form",
+    "import_accounts_status": "reads a progress file, no SQL",
+    "download_profile": "reads a profile file, no SQL",
+    # The dashboards' forms and modals POST to these; their GET templates were never added
+    "add_material": "GET only redirects", "add_video": "GET only redirects",
+    "edit_live_class": "no GET template", "edit_material": "no GET template", "edit_video": "no GET template",
+    "teacher_add_live_class": "no GET template", "teacher_add_material": "no GET template",
+    "teacher_edit_live_class": "no GET template", "teacher_edit_material": "no GET template",
+}
+
+SMALL = {"students": 40, "teachers": 8, "live_classes": 12, "materials": 16, "videos": 12}
+
+_counts = {"queries": 0, "rows": 0}
+
+
+# -----------------------
+# Counting statements and fetched rows
+# -----------------------
+class CountingCursor(sqlite3.Cursor):
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            _counts["rows"] += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = super().fetchmany(*args)
+        _counts["rows"] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        _counts["rows"] += len(rows)
+        return rows
+
+
+class CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=None):
+        return super().cursor(factory or CountingCursor)
+
+
+def _install_counters(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "do_connect")
+    def _counting_connection(dialect, conn_rec, cargs, cparams):
+        if dialect.name == "sqlite":
+            cparams["factory"] = CountingConnection
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        _counts["queries"] += 1
+        # psycopg2 reports SELECT row counts; sqlite3 doesn't (CountingCursor does)
+        if conn.dialect.name != "sqlite" and cursor.rowcount and cursor.rowcount > 0:
+            _counts["rows"] += cursor.rowcount
+
+
+# -----------------------
+# One pass over the routes
+# -----------------------
+def _clear_caches():
+    from cache import catalog_cache, fragment_cache, material_file_cache
+    from session_state import session_version_cache
+
+    for cache in (catalog_cache, fragment_cache, material_file_cache, session_version_cache):
+        cache.clear()
+
+
+def _path_ids(engine):
+    from sqlalchemy import func, select
+
+    from models import RevisionMaterial
+
+    with engine.connect() as conn:
+        return {
+            "material_id": conn.execute(
+                select(func.min(RevisionMaterial.id)).where(RevisionMaterial.file_path.is_not(None))).scalar(),
+        }
+
+
+def measure(app, engine, sizes):
+    """{(endpoint, path): (status, queries, rows)} for a freshly seeded dataset of `sizes`."""
+    from bench.dataset import ADMIN_USERNAME, BENCH_PASSWORD, generate, reset_schema
+
+    reset_schema()
+    generate(**sizes)
+    ids = _path_ids(engine)
+    clients = {None: app.test_client()}
+    for role, username in (("student", "bench-student-000001"), ("teacher", "bench-teacher-00001"),
+                           ("admin", ADMIN_USERNAME)):
+        clients[role] = app.test_client()
+        clients[role].post("/login", data={"username": username, "password": BENCH_PASSWORD})
+
+    results = {}
+    for endpoint, role, path in ROUTES:
+        _clear_caches()
+        before = dict(_counts)
+        response = clients[role].get(path.format(**ids))
+        response.close()
+        results[(endpoint, path)] = (
+            response.status_code,
+            _counts["queries"] - before["queries"],
+            _counts["rows"] - before["rows"],
+        )
+    return results
+
+
+def _label(endpoint, path):
+    return f"{endpoint} ({path})" if "?" in path else endpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-route query budget and scaling check")
+    parser.add_argument("--database-url", help="scratch database, dropped and recreated (default: temp SQLite file)")
+    parser.add_argument("--scale", type=int, default=5, help="size of the second dataset relative to the first")
+    parser.add_argument("--strict-rows", action="store_true", help="fail when rows fetched grow with the dataset")
+    args = parser.parse_args()
+
+    scratch = None
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        scratch = tempfile.mkdtemp(prefix="query-budgets-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'budgets.db')}"
+    # The app's engine must see the scratch database and the counting hooks from the start
+    os.environ.setdefault("QUERY_LOG_ENABLED", "0")
+    from connections import engine
+    from bench.dataset import reset_refusal
+    refusal = reset_refusal(engine.url)
+    if refusal:
+        parser.error(f"refusing to reset: {refusal}")
+    _install_counters(engine)
+    from app import app
+    from metrics import query_budgets
+
+    budgets = query_budgets(app)
+    small = measure(app, engine, SMALL)
+    large = measure(app, engine, {name: count * args.scale for name, count in SMALL.items()})
+
+    failures = []
+    print(f"{engine.dialect.name}, datasets x1 and x{args.scale}")
+    print(f"{'route':<52}{'status':>7}{'budget':>7}{'queries':>12}{'rows':>14}")
+    for (endpoint, path), (status, queries, rows) in small.items():
+        big_status, big_queries, big_rows = large[(endpoint, path)]
+        label = _label(endpoint, path)
+        budget = budgets.get(endpoint)
+        problems = []
+        if status != 200 or big_status != 200:
+            problems.append(f"status {status}/{big_status}")
+        if budget is not None and max(queries, big_queries) > budget:
+            problems.append(f"over budget ({max(queries, big_queries)} > {budget})")
+        if big_queries > queries:
+            problems.append(f"queries grow with data ({queries} -> {big_queries})")
+        rows_grow = rows and big_rows >= rows * args.scale / 2
+        if rows_grow and args.strict_rows:
+            problems.append(f"rows grow with data ({rows} -> {big_rows})")
+        print(f"{label:<52}{big_status:>7}{budget if budget is not None else '-':>7}"
+              f"{f'{queries} -> {big_queries}':>12}{f'{rows} -> {big_rows}':>14}"
+              f"{'  unbounded rows' if rows_grow and not args.strict_rows else ''}")
+        failures.extend(f"{label}: {problem}" for problem in problems)
+
+    covered = {endpoint for endpoint, _, _ in ROUTES}
+    uncovered = sorted(
+        rule.endpoint for rule in app.url_map.iter_rules()
+        if "GET" in rule.methods and rule.endpoint not in covered and rule.endpoint not in SKIPPED
+    )
+    for endpoint in uncovered:
+        print(f"Not covered: {endpoint} (add it to ROUTES or SKIPPED)")
+
+    if scratch:
+        engine.dispose()
+        for name in os.listdir(scratch):
+            os.remove(os.path.join(scratch, name))
+        os.rmdir(scratch)
+
+    for line in failures:
+        print(f"FAIL {line}")
+    if failures or uncovered:
+        sys.exit(1)
+    print("All routes within budget and flat in query count")
+
+
+if __name__ == "__main__":
+    main()
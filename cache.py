@@ -0,0 +1,166 @@
+# cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from content_versions import read_content_versions
+from models import ALL_FORMS, LiveClass, RevisionMaterial, Video, normalize_form
+
+# =========================
+# Generic TTL + LRU cache
+# =========================
+class TTLCache:
+    """Small thread-safe in-process cache with per-entry TTL and LRU eviction."""
+
+    def __init__(self, maxsize=64, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# =========================
+# Student content catalog
+# =========================
+CATALOG_TTL = int(os.environ.get("CATALOG_CACHE_TTL", "60"))
+CATALOG_MAXSIZE = int(os.environ.get("CATALOG_CACHE_MAXSIZE", "32"))
+
+catalog_cache = TTLCache(maxsize=CATALOG_MAXSIZE, ttl=CATALOG_TTL)
+
+
+def _snapshot(rows, *columns):
+    # Plain dicts outlive the session and are safe to share between requests
+    return [{col: getattr(row, col) for col in columns} for row in rows]
+
+
+def get_catalog(db, form, versions=None):
+    """Return the live classes, materials and videos visible to `form`.
+
+    Entries are tagged with the content versions they were built from, so a
+    write made through another worker is seen on the next request, not after
+    the TTL. Pass `versions` if the caller already read them.
+    """
+    key = normalize_form(form)
+    if versions is None:
+        versions = read_content_versions(db, key)
+    cached = catalog_cache.get(key)
+    if cached is not None and cached["versions"] == versions:
+        return cached
+
+    # Served by the (form_key, subject) indexes
+    targets = [key, ALL_FORMS]
+    live_classes = db.query(LiveClass).filter(LiveClass.form_key.in_(targets)).all()
+    revision_materials = db.query(RevisionMaterial).filter(RevisionMaterial.form_key.in_(targets)).all()
+    videos = db.query(Video).filter(Video.form_key.in_(targets)).all()
+
+    catalog = {
+        "versions": versions,
+        "live_classes": _snapshot(live_classes, "id", "title", "link", "time", "form", "subject", "active"),
+        "revision_materials": _snapshot(revision_materials, "id", "title", "subject", "form", "link", "file_path",
+                                        "link_provider", "embed_url", "download_url"),
+        "videos": _snapshot(videos, "id", "title", "link", "form", "subject", "link_provider", "embed_url"),
+    }
+    catalog_cache.set(key, catalog)
+    return catalog
+
+
+def invalidate_catalog(*forms):
+    """Drop cached catalogs affected by content targeted at any of `forms`."""
+    for form in forms:
+        key = normalize_form(form)
+        if key == ALL_FORMS:
+            # "all" content is part of every form's catalog
+            catalog_cache.clear()
+            return
+        catalog_cache.pop(key)
+
+
+# =========================
+# Rendered dashboard sections
+# =========================
+# The card lists are the same HTML for every student in a form, so each
+# (form, section) is rendered once per content version and reused until that
+# version moves (entries carry their version, so no explicit invalidation).
+# Only the per-student header is rendered per request.
+FRAGMENT_TTL = int(os.environ.get("FRAGMENT_CACHE_TTL", "300"))
+FRAGMENT_MAXSIZE = int(os.environ.get("FRAGMENT_CACHE_MAXSIZE", "96"))
+
+fragment_cache = TTLCache(maxsize=FRAGMENT_MAXSIZE, ttl=FRAGMENT_TTL)
+
+
+def get_content_fragments(db, form, versions, render_section):
+    """{section: {"html", "count"}} for `form`; `render_section(section, items)` renders the misses."""
+    key = normalize_form(form)
+    fragments, missing = {}, []
+    for section, version in versions.items():
+        cached = fragment_cache.get((key, section))
+        if cached is not None and cached["version"] == version:
+            fragments[section] = cached
+        else:
+            missing.append(section)
+
+    if missing:
+        catalog = get_catalog(db, key, versions)
+        for section in missing:
+            items = catalog[section]
+            fragments[section] = {"version": versions[section], "html": render_section(section, items),
+                                  "count": len(items)}
+            fragment_cache.set((key, section), fragments[section])
+    return fragments
+
+
+# =========================
+# Material download metadata
+# =========================
+# A PDF viewer fetches one material in many Range requests; keep the few
+# columns the download route needs so those don't each cost a DB round trip.
+material_file_cache = TTLCache(maxsize=1024, ttl=300)
+
+
+def get_material_file(db, material_id):
+    material = material_file_cache.get(material_id)
+    if material is None:
+        row = db.query(
+            RevisionMaterial.title, RevisionMaterial.link, RevisionMaterial.file_path,
+            RevisionMaterial.file_size, RevisionMaterial.file_sha256,
+        ).filter(RevisionMaterial.id == material_id).first()
+        if row is None:
+            return None
+        material = row._asdict()
+        material_file_cache.set(material_id, material)
+    return material
+
+
+def invalidate_material(material_id):
+    material_file_cache.pop(material_id)
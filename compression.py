@@ -0,0 +1,125 @@
+# compression.py
+import gzip
+import mimetypes
+import os
+
+from flask import abort, current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt; gzip only if it is missing
+    brotli = None
+
+# =========================
+# Response compression
+# =========================
+# Dynamic responses (HTML pages, JSON) are compressed in an after_request hook
+# when they are big enough, of a text-like type, and the client accepts it:
+# brotli at a low quality if the `brotli` package is installed, gzip otherwise.
+# Streams (SSE) and files (send_file) pass through untouched.
+#
+# Static files are never compressed per request: precompress.py writes .br/.gz
+# files next to them once at build/deploy time and serve_static() picks the
+# best variant the client accepts. Uploaded materials are never served from
+# here, see serve_static().
+
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+# Per-request CPU matters more than the last few percent
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "4"))
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/plain", "text/css", "text/csv", "text/javascript", "application/javascript",
+    "application/json", "application/xml", "text/xml", "image/svg+xml",
+}
+# Encodings in order of preference, with their precompressed file suffix
+STATIC_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _accepts(encoding):
+    return request.accept_encodings[encoding] > 0
+
+
+def choose_encoding():
+    """"br", "gzip" or None for the current request's Accept-Encoding."""
+    if brotli is not None and _accepts("br"):
+        return "br"
+    if _accepts("gzip"):
+        return "gzip"
+    return None
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0: identical input gives identical bytes
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _vary(response):
+    if "accept-encoding" not in {v.strip().lower() for v in response.headers.get("Vary", "").split(",")}:
+        response.headers.add("Vary", "Accept-Encoding")
+
+
+def _compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    _vary(response)
+    data = response.get_data()
+    encoding = choose_encoding()
+    if encoding is None or len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    # Same content, different bytes: a strong validator has to become weak (like nginx)
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def _is_upload(path):
+    uploads = current_app.config.get("UPLOAD_FOLDER")
+    if not uploads:
+        return False
+    uploads = os.path.realpath(uploads)
+    return os.path.commonpath([os.path.realpath(path), uploads]) == uploads
+
+
+def serve_static(filename):
+    """Flask's static view, serving a precompressed .br/.gz sibling when there is one.
+
+    Files under UPLOAD_FOLDER are refused: they need the download route's access check.
+    """
+    folder = current_app.static_folder
+    path = safe_join(folder, filename)
+    if path is None or _is_upload(path):
+        abort(404)
+    for encoding, suffix in STATIC_ENCODINGS:
+        variant = path + suffix
+        if not _accepts(encoding) or not os.path.isfile(variant):
+            continue
+        try:
+            if os.path.getmtime(variant) < os.path.getmtime(path):
+                continue  # stale: the source changed after the last precompress run
+        except OSError:
+            continue
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        response = send_from_directory(folder, filename + suffix, mimetype=mimetype,
+                                       max_age=current_app.get_send_file_max_age(filename))
+        response.headers["Content-Encoding"] = encoding
+        # No Content-Disposition: the browser must not save "logo.png.gz"
+        response.headers.pop("Content-Disposition", None)
+        _vary(response)
+        return response
+    response = current_app.send_static_file(filename)
+    _vary(response)
+    return response
+
+
+def init_compression(app):
+    app.after_request(_compress_response)
+    if app.has_static_folder:
+        app.view_functions["static"] = serve_static
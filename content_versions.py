@@ -0,0 +1,67 @@
+# content_versions.py
+import hashlib
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from models import ALL_FORMS, ContentVersion, FormTargetedMixin, LiveClass, RevisionMaterial, Video, normalize_form
+from stats import increment
+
+# =========================
+# Per-form content versions
+# =========================
+# Every write to live classes, materials or videos bumps the version of the
+# (form key, section) it touches, in the same transaction. A student's view of
+# a section is identified by the versions of their form and of "all", so:
+#   - the content API answers If-None-Match with one primary-key query,
+#   - the catalog cache can tell a stale entry from a fresh one across workers.
+# ORM writes are picked up by the before_flush hook below; Core bulk
+# statements (batch.py) call bump_content_versions() themselves.
+
+SECTIONS = tuple(model.content_section for model in (LiveClass, RevisionMaterial, Video))
+
+
+def bump_content_versions(db, changes):
+    """Bump every (form, section) pair in `changes`."""
+    for form_key, section in sorted({(normalize_form(f), s) for f, s in changes}):
+        increment(db, ContentVersion, {"form_key": form_key, "section": section}, "version")
+
+
+def read_content_versions(db, form):
+    """{section: "<form version>.<all-forms version>"} as seen by a student in `form`."""
+    key = normalize_form(form)
+    rows = db.execute(
+        select(ContentVersion.form_key, ContentVersion.section, ContentVersion.version)
+        .where(ContentVersion.form_key.in_([key, ALL_FORMS]))
+    ).all()
+    found = {(form_key, section): version for form_key, section, version in rows}
+    return {
+        section: f"{found.get((key, section), 0)}.{found.get((ALL_FORMS, section), 0)}"
+        for section in SECTIONS
+    }
+
+
+def versions_etag(form, versions, *extra):
+    """Strong ETag for a student's content built from `versions` (and anything in `extra`)."""
+    raw = "|".join([normalize_form(form)] + [f"{s}={versions[s]}" for s in SECTIONS] + [str(e) for e in extra])
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+@event.listens_for(Session, "before_flush")
+def _track_content_changes(session, flush_context, instances):
+    changes = set()
+    for obj in session.new:
+        if isinstance(obj, FormTargetedMixin):
+            changes.add((obj.form_key, obj.content_section))
+    for obj in session.deleted:
+        if isinstance(obj, FormTargetedMixin):
+            changes.add((obj.form_key, obj.content_section))
+    for obj in session.dirty:
+        if isinstance(obj, FormTargetedMixin) and session.is_modified(obj):
+            # A form change moves the item out of the old form's section too
+            history = inspect(obj).attrs.form_key.history
+            for form_key in (history.deleted or ()):
+                changes.add((form_key, obj.content_section))
+            changes.add((obj.form_key, obj.content_section))
+    if changes:
+        bump_content_versions(session, changes)
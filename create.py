@@ -1,8 +1,13 @@
 from connections import Base, engine
 from models import User
+from search import install_search_index
 
 # Drop all tables and recreate them to reflect the latest model changes
 Base.metadata.drop_all(bind=engine)
 Base.metadata.create_all(bind=engine)
 
+# Dialect-specific search index (pg_trgm / FTS5) that the models can't declare
+with engine.begin() as conn:
+    install_search_index(conn)
+
 print("Tables recreated with latest columns")
\ No newline at end of file
@@ -0,0 +1,39 @@
+# gunicorn.conf.py
+# Picked up automatically by `gunicorn app:app` run from this folder.
+#
+# gevent workers: every open /api/student/events stream is an idle greenlet,
+# not a thread, so one worker holds thousands of them. Without gevent
+# installed this falls back to threads (fine for development, but each
+# stream then occupies one of the `threads`).
+import os
+from importlib.util import find_spec
+
+bind = os.environ.get("BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get("WEB_CONCURRENCY", (os.cpu_count() or 1) + 1))
+
+# Each open events stream holds a connection (gevent) or a thread (gthread) for
+# as long as the tab is open: cap them per worker (live_events.py) so ordinary
+# requests always find a free one. Over the cap, dashboards poll instead.
+if find_spec("gevent"):
+    worker_class = "gevent"
+    worker_connections = int(os.environ.get("WORKER_CONNECTIONS", "2000"))
+    os.environ.setdefault("LIVE_EVENTS_MAX_STREAMS", str(worker_connections * 3 // 4))
+else:
+    worker_class = "gthread"
+    threads = int(os.environ.get("THREADS", "8"))
+    os.environ.setdefault("LIVE_EVENTS_MAX_STREAMS", str(threads // 4))
+
+# Async workers heartbeat from the event loop, so long-lived streams don't trip this
+timeout = int(os.environ.get("WORKER_TIMEOUT", "30"))
+graceful_timeout = 10
+keepalive = 5
+# Not preloaded: gevent must patch the stdlib before the app (and its pools) import
+preload_app = False
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent" and find_spec("psycogreen"):
+        # psycopg2 waits on the gevent hub instead of blocking the whole worker
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
@@ -1,5 +1,6 @@
 from connections import SessionLocal
 from models import User
+from stats import user_registered
 
 # Create a database session
 db = SessionLocal()
@@ -15,6 +16,7 @@ try:
             role="admin"
         )
         db.add(new_admin)
+        user_registered(db, "admin")
         db.commit()
         print("✅ Default admin created: username=admin, password=admin123, role=admin")
     else:
@@ -0,0 +1,86 @@
+# links.py
+import re
+from collections import namedtuple
+from urllib.parse import parse_qs, urlsplit
+
+# =========================
+# Content link normalization
+# =========================
+# Admins and teachers paste whatever URL their browser shows. parse_link()
+# turns it into the few things the app needs, once, at write time:
+#   provider      "gdrive", "youtube", "vimeo", "local" (uploaded file) or "link"
+#   file_id       the provider's id, when there is one
+#   embed_url     what an <iframe> should load
+#   download_url  a direct download, when the provider has one
+# The models keep these as columns (see LinkedContentMixin) so templates only
+# read attributes.
+
+LinkInfo = namedtuple("LinkInfo", "provider file_id embed_url download_url")
+
+EMPTY_LINK = LinkInfo(None, None, None, None)
+
+_DRIVE_PATH = re.compile(r"/(?:file/d|document/d|presentation/d|spreadsheets/d)/([\w-]+)")
+_YOUTUBE_PATH = re.compile(r"^/(?:embed|shorts|live|v)/([\w-]{6,})")
+_VIMEO_PATH = re.compile(r"^/(?:video/)?(\d+)")
+
+
+def _drive(file_id):
+    return LinkInfo(
+        "gdrive",
+        file_id,
+        f"https://drive.google.com/file/d/{file_id}/preview",
+        f"https://drive.google.com/uc?export=download&id={file_id}",
+    )
+
+
+def _youtube(video_id):
+    return LinkInfo("youtube", video_id, f"https://www.youtube.com/embed/{video_id}", None)
+
+
+def parse_link(url):
+    """LinkInfo for a pasted URL (EMPTY_LINK for a blank one)."""
+    url = (url or "").strip()
+    if not url:
+        return EMPTY_LINK
+    if url.startswith("/"):
+        # Our own static files (uploads from before the download route)
+        return LinkInfo("local", None, url, url)
+
+    parts = urlsplit(url if "://" in url else f"https://{url}")
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = parse_qs(parts.query)
+
+    if host in ("drive.google.com", "docs.google.com"):
+        match = _DRIVE_PATH.search(parts.path)
+        # /file/d/<id>/view, /open?id=<id>, /uc?export=download&id=<id>
+        file_id = match.group(1) if match else (query.get("id") or [None])[0]
+        if file_id:
+            return _drive(file_id)
+
+    if host in ("youtube.com", "m.youtube.com", "youtube-nocookie.com"):
+        match = _YOUTUBE_PATH.match(parts.path)
+        video_id = match.group(1) if match else (query.get("v") or [None])[0]
+        if video_id:
+            return _youtube(video_id)
+    if host == "youtu.be" and parts.path.strip("/"):
+        return _youtube(parts.path.strip("/").split("/")[0])
+
+    if host in ("vimeo.com", "player.vimeo.com"):
+        match = _VIMEO_PATH.match(parts.path)
+        if match:
+            return LinkInfo("vimeo", match.group(1), f"https://player.vimeo.com/video/{match.group(1)}", None)
+
+    return LinkInfo("link", None, url, url)
+
+
+def link_columns(url):
+    """parse_link() as the column values stored next to `link`."""
+    info = parse_link(url)
+    return {
+        "link_provider": info.provider,
+        "link_file_id": info.file_id,
+        "embed_url": info.embed_url,
+        "download_url": info.download_url,
+    }
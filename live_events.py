@@ -0,0 +1,308 @@
+# live_events.py
+import glob
+import json
+import os
+import queue
+import select as select_module
+import socket
+import threading
+import time
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from connections import engine
+from models import ALL_FORMS, FormTargetedMixin, LiveClass, normalize_form
+
+# =========================
+# Live content events (Server-Sent Events)
+# =========================
+# Students keep one /api/student/events stream open instead of reloading the
+# dashboard. Content writes are picked up from the ORM session (like the
+# content versions) and published when the transaction commits:
+#   class_started   a live class was created active or switched to active
+#   new_class / new_material / new_video
+# Each message is {"type", "form", "section", "id", "title"}; the browser
+# reacts by revalidating the content API, which is cheap when nothing moved.
+#
+# Delivery to every worker process:
+#   postgres  pg_notify() inside the writing transaction (sent on commit only),
+#             one LISTEN connection per worker
+#   unix      a datagram socket per worker under LIVE_EVENTS_SOCKET_DIR; the
+#             committing worker sends to all of them (single host, any DB)
+#   local     this process only (dev server, tests)
+# Default: postgres on PostgreSQL, unix otherwise.
+
+CHANNEL = "live_events"
+LIVE_EVENTS_BACKEND = os.environ.get("LIVE_EVENTS_BACKEND", "")
+LIVE_EVENTS_SOCKET_DIR = os.environ.get("LIVE_EVENTS_SOCKET_DIR", "")
+# Events waiting for one slow client before it starts missing them
+SUBSCRIBER_QUEUE = 100
+KEEPALIVE_SECONDS = 20
+RETRY_MS = 5000
+# Open streams per worker; over it the client falls back to polling. Each stream
+# holds a connection (gevent worker) or a whole thread (gthread) for as long as
+# the tab is open, so gunicorn.conf.py derives this from worker_connections or
+# threads; the fallback here assumes a thread worker.
+LIVE_EVENTS_MAX_STREAMS = int(os.environ.get("LIVE_EVENTS_MAX_STREAMS", "2"))
+
+NEW_EVENTS = {"live_classes": "new_class", "revision_materials": "new_material", "videos": "new_video"}
+
+
+def content_event(kind, section, form, item_id, title):
+    return {"type": kind, "form": normalize_form(form), "section": section, "id": item_id, "title": title}
+
+
+# -----------------------
+# In-process hub
+# -----------------------
+class TooManyStreams(Exception):
+    """This worker already holds LIVE_EVENTS_MAX_STREAMS streams."""
+
+
+class Hub:
+    """Subscriber queues per form key; ALL_FORMS messages go to everyone."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, form, limit=None):
+        """A new subscriber queue; TooManyStreams if `limit` subscribers already exist."""
+        subscriber = queue.Queue(SUBSCRIBER_QUEUE)
+        with self._lock:
+            if limit is not None and sum(len(s) for s in self._subscribers.values()) >= limit:
+                raise TooManyStreams()
+            self._subscribers.setdefault(normalize_form(form), set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, form, subscriber):
+        with self._lock:
+            self._subscribers.get(normalize_form(form), set()).discard(subscriber)
+
+    def count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def dispatch(self, message):
+        with self._lock:
+            if message["form"] == ALL_FORMS:
+                targets = [s for subscribers in self._subscribers.values() for s in subscribers]
+            else:
+                targets = list(self._subscribers.get(message["form"], ()))
+        for subscriber in targets:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                pass  # it catches up from the content API on its next event or reconnect
+
+
+hub = Hub()
+
+
+# -----------------------
+# Cross-worker delivery
+# -----------------------
+class LocalBackend:
+    transactional = False
+
+    def start(self):
+        pass
+
+    def send(self, messages):
+        for message in messages:
+            hub.dispatch(message)
+
+
+class UnixSocketBackend:
+    """One datagram socket per worker process; senders write to every socket in the folder."""
+
+    transactional = False
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # Never block the committing request on a backed-up worker
+        self._sender.setblocking(False)
+
+    def start(self):
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, f"{os.getpid()}.sock")
+        if os.path.exists(path):
+            os.remove(path)  # left behind by a dead process with the same pid
+        receiver = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        receiver.bind(path)
+        threading.Thread(target=self._receive, args=(receiver,), name="live-events", daemon=True).start()
+
+    def _receive(self, receiver):
+        while True:
+            payload = receiver.recv(65536)
+            try:
+                hub.dispatch(json.loads(payload))
+            except (ValueError, KeyError):
+                continue
+
+    def send(self, messages):
+        payloads = [json.dumps(m).encode() for m in messages]
+        for path in glob.glob(os.path.join(self.folder, "*.sock")):
+            try:
+                for payload in payloads:
+                    self._sender.sendto(payload, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker is gone
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                pass  # that worker is backed up; its clients will revalidate later
+
+
+class PostgresBackend:
+    """NOTIFY in the writing transaction, LISTEN on a dedicated connection per worker."""
+
+    transactional = True
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def notify(self, connection, messages):
+        for message in messages:
+            connection.execute(select(func.pg_notify(CHANNEL, json.dumps(message))))
+
+    def start(self):
+        threading.Thread(target=self._listen, name="live-events", daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                # Kept out of the pool for good: it sits in LISTEN forever
+                raw = self.engine.raw_connection()
+                raw.detach()
+                connection = raw.dbapi_connection
+                connection.autocommit = True
+                connection.cursor().execute(f"LISTEN {CHANNEL}")
+                while True:
+                    if select_module.select([connection], [], [], KEEPALIVE_SECONDS) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        try:
+                            hub.dispatch(json.loads(notification.payload))
+                        except (ValueError, KeyError):
+                            continue
+            except Exception:
+                time.sleep(1)  # database restart: reconnect and LISTEN again
+
+
+_backend = None
+_started_pid = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = LIVE_EVENTS_BACKEND or ("postgres" if engine.dialect.name == "postgresql" else "unix")
+        if name == "postgres":
+            _backend = PostgresBackend(engine)
+        elif name == "unix":
+            folder = LIVE_EVENTS_SOCKET_DIR or os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), "instance", "live_events")
+            _backend = UnixSocketBackend(folder)
+        else:
+            _backend = LocalBackend()
+    return _backend
+
+
+def _ensure_listening():
+    # Per process, on the first stream: gunicorn workers fork after import
+    global _started_pid
+    with _backend_lock:
+        if _started_pid != os.getpid():
+            get_backend().start()
+            _started_pid = os.getpid()
+
+
+# -----------------------
+# Publishing from the ORM session
+# -----------------------
+def queue_events(session, messages):
+    """Publish `messages` when `session` commits (dropped on rollback)."""
+    if not messages:
+        return
+    backend = get_backend()
+    if backend.transactional:
+        backend.notify(session.connection(), messages)
+    else:
+        session.info.setdefault("live_events", []).extend(messages)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_events(session, flush_context):
+    # new/dirty and attribute history still show the pre-flush state here
+    messages = []
+    for obj in session.new:
+        if isinstance(obj, FormTargetedMixin):
+            messages.append(content_event(NEW_EVENTS[obj.content_section], obj.content_section,
+                                          obj.form, obj.id, obj.title))
+            if isinstance(obj, LiveClass) and obj.active:
+                messages.append(content_event("class_started", obj.content_section, obj.form, obj.id, obj.title))
+    for obj in session.dirty:
+        if isinstance(obj, LiveClass):
+            history = inspect(obj).attrs.active.history
+            if any(history.added) and not any(history.deleted):
+                messages.append(content_event("class_started", obj.content_section, obj.form, obj.id, obj.title))
+    queue_events(session, messages)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_events(session):
+    messages = session.info.pop("live_events", None)
+    if messages:
+        get_backend().send(messages)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_events(session):
+    session.info.pop("live_events", None)
+
+
+# -----------------------
+# The stream
+# -----------------------
+class EventStream:
+    """SSE body for one subscriber; close() (called by the WSGI server) unsubscribes.
+
+    A class rather than a generator: close() on a generator that never started
+    skips its `finally`, and the slot is taken before the response starts.
+    """
+
+    def __init__(self, form):
+        self.form = form
+        # Reserved here, atomically, so a burst of page loads can't overshoot the cap
+        self.subscriber = hub.subscribe(form, limit=LIVE_EVENTS_MAX_STREAMS)
+
+    def __iter__(self):
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            while True:
+                try:
+                    message = self.subscriber.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # Also how a closed connection is noticed
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+        finally:
+            self.close()
+
+    def close(self):
+        hub.unsubscribe(self.form, self.subscriber)
+
+
+def event_stream(form):
+    """SSE body for a student in `form`; TooManyStreams when this worker is full."""
+    _ensure_listening()
+    return EventStream(form)
@@ -0,0 +1,230 @@
+# metrics.py
+import bisect
+import contextvars
+import os
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# =========================
+# Per-request SQL / latency metrics
+# =========================
+# For every request we record, under the Flask endpoint name:
+#   - wall time
+#   - number of SQL statements and total time spent executing them
+#   - time spent waiting for a pooled connection (TimedQueuePool)
+# into fixed-bucket histograms, exported in Prometheus text format by the
+# admin /metrics route. Numbers are per process: with several gunicorn workers
+# each one reports its own (scrape them individually or sum in Prometheus).
+#
+# Views can declare how many queries they are expected to run with
+# @query_budget(n); going over is logged and counted.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+
+
+class Histogram:
+    """Fixed-bucket histogram keyed by a label tuple (Prometheus semantics)."""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.snapshot().items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(f"{self.name}{{{_labels(self.label_names, labels)}}} {value}" for labels, value in items)
+        return lines
+
+
+def _labels(names, values):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{n}="{escape(v)}"' for n, v in zip(names, values))
+
+
+request_duration = Histogram("http_request_duration_seconds", "Wall time per request.",
+                             ("route", "method"), LATENCY_BUCKETS)
+request_queries = Histogram("db_queries_per_request", "SQL statements executed per request.",
+                            ("route",), QUERY_COUNT_BUCKETS)
+request_db_time = Histogram("db_time_per_request_seconds", "Time spent executing SQL per request.",
+                            ("route",), DB_TIME_BUCKETS)
+request_pool_wait = Histogram("db_pool_wait_per_request_seconds", "Time spent waiting for a pooled connection.",
+                              ("route",), POOL_WAIT_BUCKETS)
+requests_total = Counter("http_requests_total", "Requests by route and status.", ("route", "method", "status"))
+budget_exceeded = Counter("db_query_budget_exceeded_total", "Requests that ran more queries than their budget.",
+                          ("route",))
+
+# -----------------------
+# Per-request accumulator
+# -----------------------
+class RequestStats:
+    __slots__ = ("started", "queries", "db_time", "pool_wait")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+
+
+# A context variable, not flask.g: the SQLAlchemy events fire outside any
+# Flask API and this also works per greenlet
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that charges the time spent waiting for a connection to the current request."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.pool_wait += time.perf_counter() - started
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+def query_budget(max_queries):
+    """Declare how many SQL statements a view should need; more is logged and counted.
+
+    Only tags the function (functools.wraps in outer decorators carries it along).
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def query_budgets(app):
+    """{endpoint: budget} for every view that declares one."""
+    return {
+        endpoint: view.query_budget
+        for endpoint, view in app.view_functions.items()
+        if getattr(view, "query_budget", None) is not None
+    }
+
+
+def init_metrics(app, *engines):
+    """Hook the engines (primary and replicas) and the app's request lifecycle."""
+    if not METRICS_ENABLED:
+        return
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+    @app.before_request
+    def _start_request_stats():
+        request.environ["metrics.token"] = _current.set(RequestStats())
+
+    @app.teardown_request
+    def _finish_request_stats(exc):
+        token = request.environ.pop("metrics.token", None)
+        stats = _current.get()
+        if token is None or stats is None:
+            return
+        _current.reset(token)
+        route = request.endpoint or "unmatched"
+        request_duration.observe((route, request.method), time.perf_counter() - stats.started)
+        request_queries.observe((route,), stats.queries)
+        request_db_time.observe((route,), stats.db_time)
+        request_pool_wait.observe((route,), stats.pool_wait)
+
+        budget = getattr(app.view_functions.get(route), "query_budget", None)
+        if budget is not None and stats.queries > budget:
+            budget_exceeded.inc((route,))
+            app.logger.warning("%s ran %d queries (budget %d)", route, stats.queries, budget)
+
+    @app.after_request
+    def _count_request(response):
+        requests_total.inc((request.endpoint or "unmatched", request.method, str(response.status_code)))
+        return response
+
+
+def render_metrics(app):
+    """Everything in Prometheus text exposition format."""
+    lines = []
+    for metric in (request_duration, request_queries, request_db_time, request_pool_wait,
+                   requests_total, budget_exceeded):
+        lines.extend(metric.render())
+    lines.append("# HELP db_query_budget Declared per-view query budget.")
+    lines.append("# TYPE db_query_budget gauge")
+    for route, budget in sorted(query_budgets(app).items()):
+        lines.append(f'db_query_budget{{route="{route}"}} {budget}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,199 @@
+# migrate.py
+# Idempotent, in-place schema upgrades for databases created before a model
+# change (create.py drops everything, this keeps the data).
+#
+#   python migrate.py            -> run every step
+#   python migrate.py form_key   -> run only the named step(s)
+import os
+import sys
+
+from sqlalchemy import bindparam, inspect, select, text, update
+
+from connections import engine
+from links import link_columns
+from models import (FORM_KEY_LENGTH, CompleteProfile, ContentVersion, LiveClass, RevisionMaterial, StatCounter, Video,
+                    normalize_form)
+from search import install_search_index
+from stats import rebuild_stats
+from storage import hash_file
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+
+def _has_column(conn, table, column):
+    return column in {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _create_indexes(conn, table, column):
+    """Create the model's indexes on `table` that include `column`.
+
+    Only those: other indexes may cover columns a later step adds.
+    """
+    for index in table.indexes:
+        if column in index.columns:
+            index.create(conn, checkfirst=True)
+
+
+# -----------------------
+# form_key: canonical, indexed form targeting for content
+# -----------------------
+def _widen_form_key(conn, table_name):
+    # Columns first added as VARCHAR(20) (SQLite doesn't enforce lengths)
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN form_key TYPE VARCHAR({FORM_KEY_LENGTH})"))
+
+
+def add_form_key(conn):
+    for model in (LiveClass, RevisionMaterial, Video):
+        table = model.__table__
+        if not _has_column(conn, table.name, "form_key"):
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN form_key VARCHAR({FORM_KEY_LENGTH})"))
+        _widen_form_key(conn, table.name)
+
+        # One UPDATE per distinct raw value keeps the backfill set-based
+        raw_forms = conn.execute(select(model.form).distinct()).scalars().all()
+        for raw in raw_forms:
+            condition = model.form.is_(None) if raw is None else model.form == raw
+            conn.execute(update(table).where(condition).values(form_key=normalize_form(raw)))
+
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN form_key SET NOT NULL"))
+
+        _create_indexes(conn, table, "form_key")
+
+
+# -----------------------
+# student_sort_indexes: (sort column, id) indexes for keyset pagination
+# -----------------------
+def add_student_sort_indexes(conn):
+    # The (sort column, id) pairs
+    _create_indexes(conn, CompleteProfile.__table__, "id")
+
+
+# -----------------------
+# student_search: pg_trgm GIN index (Postgres) / FTS5 table (SQLite)
+# -----------------------
+def add_student_search(conn):
+    install_search_index(conn)
+
+
+# -----------------------
+# dashboard_stats: counters table for the admin dashboard, recounted from scratch
+# -----------------------
+def add_dashboard_stats(conn):
+    StatCounter.__table__.create(conn, checkfirst=True)
+    rebuild_stats(conn)
+
+
+# -----------------------
+# session_version: lets admin actions invalidate cached session state
+# -----------------------
+def add_session_version(conn):
+    if not _has_column(conn, "users", "session_version"):
+        conn.execute(text("ALTER TABLE users ADD COLUMN session_version INTEGER NOT NULL DEFAULT 1"))
+
+
+# -----------------------
+# material_files: size/hash columns for uploaded materials, backfilled from disk
+# -----------------------
+def add_material_files(conn):
+    table = RevisionMaterial.__table__
+    if not _has_column(conn, table.name, "file_size"):
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN file_size INTEGER"))
+    if not _has_column(conn, table.name, "file_sha256"):
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN file_sha256 VARCHAR(64)"))
+    _create_indexes(conn, table, "file_sha256")
+
+    # Files uploaded before this change only live in the link ("/static/materials/x.pdf")
+    rows = conn.execute(
+        select(RevisionMaterial.id, RevisionMaterial.link, RevisionMaterial.file_path)
+        .where(RevisionMaterial.file_sha256.is_(None))
+    ).all()
+    for row_id, link, file_path in rows:
+        if not file_path and link and link.startswith("/static/materials/"):
+            file_path = link[len("/static/"):]
+        if not file_path or not os.path.isfile(os.path.join(STATIC_FOLDER, file_path)):
+            continue
+        size, digest = hash_file(os.path.join(STATIC_FOLDER, file_path))
+        conn.execute(
+            update(table).where(table.c.id == row_id)
+            .values(file_path=file_path, file_size=size, file_sha256=digest)
+        )
+
+
+# -----------------------
+# content_versions: per-form change counters behind the student content ETags
+# -----------------------
+def add_content_versions(conn):
+    ContentVersion.__table__.create(conn, checkfirst=True)
+    _widen_form_key(conn, ContentVersion.__tablename__)
+
+
+# -----------------------
+# link_fields: provider / file id / embed and download URLs derived from `link`
+# -----------------------
+LINK_COLUMNS = {
+    "link_provider": "VARCHAR(20)",
+    "link_file_id": "VARCHAR(200)",
+    "embed_url": "VARCHAR(500)",
+    "download_url": "VARCHAR(500)",
+}
+
+
+def add_link_fields(conn):
+    for model in (RevisionMaterial, Video):
+        table = model.__table__
+        for column, sql_type in LINK_COLUMNS.items():
+            if not _has_column(conn, table.name, column):
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column} {sql_type}"))
+
+        # Recomputed for every row, so rerunning picks up parser changes too
+        rows = conn.execute(select(table.c.id, table.c.link)).all()
+        params = [dict(link_columns(link), row_id=row_id) for row_id, link in rows]
+        if params:
+            conn.execute(
+                update(table).where(table.c.id == bindparam("row_id")).values(
+                    {column: bindparam(column) for column in LINK_COLUMNS}
+                ),
+                params,
+            )
+
+    # Rendered sections cached by running workers must pick up the new columns
+    conn.execute(update(ContentVersion).values(version=ContentVersion.version + 1))
+
+
+# -----------------------
+# private_materials: uploads are only reachable through the download route
+# -----------------------
+def drop_static_material_links(conn):
+    # Uploads used to keep their public "/static/materials/x.pdf" URL in `link`;
+    # run after material_files, which reads file_path from those links
+    table = RevisionMaterial.__table__
+    result = conn.execute(
+        update(table)
+        .where(table.c.file_path.is_not(None), table.c.link.like("/static/%"))
+        .values(link=None, **link_columns(None))
+    )
+    if result.rowcount:
+        conn.execute(update(ContentVersion).values(version=ContentVersion.version + 1))
+
+
+STEPS = {
+    "form_key": add_form_key,
+    "student_sort_indexes": add_student_sort_indexes,
+    "student_search": add_student_search,
+    "dashboard_stats": add_dashboard_stats,
+    "session_version": add_session_version,
+    "material_files": add_material_files,
+    "content_versions": add_content_versions,
+    "link_fields": add_link_fields,
+    "private_materials": drop_static_material_links,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(STEPS)
+    for name in selected:
+        with engine.begin() as conn:
+            STEPS[name](conn)
+        print(f"✅ {name}")
@@ -1,6 +1,55 @@
-from sqlalchemy import Column, String, Integer, ForeignKey,Boolean
-from sqlalchemy.orm import relationship
+import re
+
+from sqlalchemy import Column, String, Integer, ForeignKey, Boolean, Index
+from sqlalchemy.orm import relationship, validates
 from connections import Base
+from links import link_columns
+
+# =========================
+# Form targeting
+# =========================
+# Content aimed at every form is stored with this key instead of "all"/""/NULL
+ALL_FORMS = "all"
+# As wide as the widest `form` column (LiveClass.form): a key is never longer than its form
+FORM_KEY_LENGTH = 200
+
+_FORM_NUMBER = re.compile(r"^(?:form)?\s*(\d+)$")
+
+def normalize_form(form):
+    """Canonical form key: "Form 3", " form 3 ", "form3" and "3" all become "form 3"."""
+    key = " ".join((form or "").split()).lower()
+    if key in ("", ALL_FORMS):
+        return ALL_FORMS
+    match = _FORM_NUMBER.match(key)
+    if match:
+        return f"form {int(match.group(1))}"
+    return key
+
+
+class FormTargetedMixin:
+    # Key of this content type in the student catalog / content_versions
+    content_section = None
+
+    # Written on every insert/update so lookups can use a plain index
+    form_key = Column(String(FORM_KEY_LENGTH), nullable=False, default=ALL_FORMS)
+
+    @validates("form")
+    def _set_form_key(self, key, value):
+        self.form_key = normalize_form(value)
+        return value
+
+class LinkedContentMixin:
+    # Derived from `link` on every ORM write (see links.py)
+    link_provider = Column(String(20), nullable=True)
+    link_file_id = Column(String(200), nullable=True)
+    embed_url = Column(String(500), nullable=True)
+    download_url = Column(String(500), nullable=True)
+
+    @validates("link")
+    def _set_link_columns(self, key, value):
+        for column, derived in link_columns(value).items():
+            setattr(self, column, derived)
+        return value
 
 # =========================
 # User Model (Authentication)
@@ -12,6 +61,8 @@ class User(Base):
     username = Column(String(100), nullable=False, unique=True)
     password = Column(String(255), nullable=False)
     role = Column(String(50), nullable=False) # roles: admin, student, teacher
+    # Bumped by admin actions so cached session state (session_state.py) is reloaded
+    session_version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # One-to-one relationship with CompleteProfile
     profile = relationship("CompleteProfile", back_populates="user", uselist=False)
@@ -27,6 +78,13 @@ class User(Base):
 # =========================
 class CompleteProfile(Base):
     __tablename__ = "complete_profile"
+    # (sort column, id) pairs back keyset pagination in manage_students
+    __table_args__ = (
+        Index("ix_complete_profile_first_name_id", "first_name", "id"),
+        Index("ix_complete_profile_last_name_id", "last_name", "id"),
+        Index("ix_complete_profile_form_id", "form", "id"),
+        Index("ix_complete_profile_contact_no_id", "contact_no", "id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
 
@@ -56,8 +114,10 @@ class CompleteProfile(Base):
 # =========================
 # LiveClass Model
 # =========================
-class LiveClass(Base):
+class LiveClass(FormTargetedMixin, Base):
     __tablename__ = "live_classes"
+    __table_args__ = (Index("ix_live_classes_form_key_subject", "form_key", "subject"),)
+    content_section = "live_classes"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String(200), nullable=False)
@@ -67,21 +127,27 @@ class LiveClass(Base):
     subject = Column(String(100), nullable=True)  # Optional: specify subject (e.g., Math, Science)
     active = Column(Boolean, default=False)
 
-class RevisionMaterial(Base):
+class RevisionMaterial(FormTargetedMixin, LinkedContentMixin, Base):
     __tablename__ = "revision_materials"
+    __table_args__ = (Index("ix_revision_materials_form_key_subject", "form_key", "subject"),)
+    content_section = "revision_materials"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String(200), nullable=False)
     subject = Column(String(100), nullable=True)  # Only define once
     form = Column(String(20), nullable=True)
     link = Column(String(255), nullable=True)  # Add this for external links like Google Drive
-    file_path = Column(String(255), nullable=True)  # Optional: for uploaded files
+    file_path = Column(String(255), nullable=True)  # Optional: for uploaded files, relative to static/
+    file_size = Column(Integer, nullable=True)  # Bytes, for uploaded files
+    file_sha256 = Column(String(64), nullable=True, index=True)  # Content hash (storage key / ETag)
 
 # =========================
 # Video Model
 # =========================
-class Video(Base):
+class Video(FormTargetedMixin, LinkedContentMixin, Base):
     __tablename__ = "videos"
+    __table_args__ = (Index("ix_videos_form_key_subject", "form_key", "subject"),)
+    content_section = "videos"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     title = Column(String(200), nullable=False)
@@ -100,3 +166,34 @@ class Teacher(Base):
     phone_number = Column(String(20), nullable=False, unique=True)
     subject = Column(String(100), nullable=False)
     is_approved = Column(Boolean, default=False)  # <--- ADD THIS LINE
+
+
+# =========================
+# Dashboard statistics
+# =========================
+class StatCounter(Base):
+    """One named counter, e.g. "students.active.form 3" or "teachers.pending".
+
+    Maintained incrementally by the write routes (see stats.py) so the admin
+    dashboard reads a handful of rows instead of counting tables.
+    """
+    __tablename__ = "stat_counters"
+
+    name = Column(String(100), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+# =========================
+# Student content versions
+# =========================
+class ContentVersion(Base):
+    """Change counter per (form key, catalog section), e.g. ("form 3", "videos").
+
+    Bumped in the same transaction as every content write (see
+    content_versions.py); the student content API derives its ETag from it.
+    """
+    __tablename__ = "content_versions"
+
+    form_key = Column(String(FORM_KEY_LENGTH), primary_key=True)
+    section = Column(String(30), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,100 @@
+# pagination.py
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+# =========================
+# Keyset (seek) pagination
+# =========================
+# Pages are addressed by the (sort value, id) of a boundary row instead of an
+# OFFSET, so every page is an index range scan no matter how deep it is.
+
+def encode_cursor(value, row_id):
+    raw = json.dumps([value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _matches_column(value, sort_column):
+    if value is None:
+        return bool(getattr(sort_column, "nullable", False))
+    try:
+        python_type = sort_column.type.python_type
+    except NotImplementedError:
+        return False
+    if isinstance(value, bool) and python_type is not bool:
+        return False
+    if python_type is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, python_type)
+
+
+def decode_cursor(cursor, sort_column=None):
+    """Return (value, id) or None for a missing/garbled cursor.
+
+    With `sort_column`, a value of the wrong type for it (a tampered cursor,
+    or one from another sort order) counts as garbled too.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        return None
+    # Bound as query parameters: only scalars a sort column can hold
+    if not isinstance(value, (str, int, float, type(None))):
+        return None
+    if not isinstance(row_id, int) or isinstance(row_id, bool):
+        return None
+    if sort_column is not None and not _matches_column(value, sort_column):
+        return None
+    return value, row_id
+
+
+def keyset_page(query, sort_column, id_column, descending=False, after=None, before=None, limit=50):
+    """Fetch one page of `query` ordered by (sort_column, id_column).
+
+    `after`/`before` are cursors from a previous page. Returns
+    (rows, next_cursor, prev_cursor); a cursor is None when there is no page
+    in that direction.
+    """
+    sort_key = sort_column.key
+    backwards = before is not None and after is None
+    # A bad cursor starts again from the first page
+    boundary = decode_cursor(before if backwards else after, sort_column)
+
+    # Walking backwards is a forward walk in the opposite order, reversed afterwards
+    reverse = descending != backwards
+    if boundary is not None:
+        value, row_id = boundary
+        if reverse:
+            seek = or_(sort_column < value, and_(sort_column == value, id_column < row_id))
+        else:
+            seek = or_(sort_column > value, and_(sort_column == value, id_column > row_id))
+        query = query.filter(seek)
+
+    if reverse:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    def cursor_for(row):
+        return encode_cursor(getattr(row, sort_key), getattr(row, id_column.key))
+
+    if backwards:
+        next_cursor = cursor_for(rows[-1])
+        prev_cursor = cursor_for(rows[0]) if has_more else None
+    else:
+        next_cursor = cursor_for(rows[-1]) if has_more else None
+        prev_cursor = cursor_for(rows[0]) if boundary is not None else None
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,110 @@
+# passwords.py
+import hmac
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# =========================
+# Hash settings
+# =========================
+# Any Werkzeug method string: "scrypt:32768:8:1" (Werkzeug's default),
+# "scrypt:16384:8:1", "pbkdf2:sha256:600000", ... `python -m bench.passwords`
+# reports logins/sec per core for each setting.
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_SALT_LENGTH = int(os.environ.get("PASSWORD_SALT_LENGTH", "16"))
+
+# Admission control: at most HASH_WORKERS hashes run at once per process and
+# at most HASH_QUEUE more wait (up to HASH_WAIT_SECONDS) for a slot. A login
+# burst gets turned away early instead of starving every other request.
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", "8"))
+HASH_WAIT_SECONDS = float(os.environ.get("PASSWORD_HASH_WAIT_SECONDS", "2"))
+
+_HASH_METHODS = ("scrypt", "pbkdf2")
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing executor is saturated; callers answer 503."""
+
+
+_admission = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE)
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def gevent_patched():
+    """True inside a gevent worker, where threading has been monkey-patched."""
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    # Threads don't survive fork: each gunicorn worker builds its own pool
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            if gevent_patched():
+                # Under the gevent worker "threads" are greenlets and a hash would
+                # stall every stream in the process: use gevent's real OS threads
+                from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+                _executor = GeventThreadPoolExecutor(max_workers=HASH_WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pwhash")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _run_bounded(fn, *args, **kwargs):
+    if not _admission.acquire(timeout=HASH_WAIT_SECONDS):
+        raise HashingBusy()
+    try:
+        # scrypt/pbkdf2 release the GIL, so the pool caps real CPU use
+        return _get_executor().submit(fn, *args, **kwargs).result()
+    finally:
+        _admission.release()
+
+
+# =========================
+# Public helpers
+# =========================
+def is_password_hash(stored):
+    parts = (stored or "").split("$")
+    return len(parts) == 3 and parts[0].split(":", 1)[0] in _HASH_METHODS
+
+
+@lru_cache(maxsize=1)
+def _current_prefix():
+    # "scrypt" -> "scrypt:32768:8:1": let Werkzeug fill in its defaults once
+    return generate_password_hash("", method=PASSWORD_HASH_METHOD, salt_length=1).split("$", 1)[0]
+
+
+def make_password_hash(password):
+    """Hash in the calling thread/process, without admission control.
+
+    Importable on its own so bulk imports can run it in worker processes.
+    """
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD, salt_length=PASSWORD_SALT_LENGTH)
+
+
+def hash_password(password):
+    return _run_bounded(make_password_hash, password)
+
+
+def verify_password(stored, password):
+    """Check `password` against a stored hash (or a legacy plaintext value)."""
+    if not stored:
+        return False
+    if not is_password_hash(stored):
+        # Legacy rows written before passwords were hashed
+        return hmac.compare_digest(stored.encode(), password.encode())
+    return _run_bounded(check_password_hash, stored, password)
+
+
+def needs_rehash(stored):
+    """True for plaintext rows and hashes made with other settings than today's."""
+    return not is_password_hash(stored) or stored.split("$", 1)[0] != _current_prefix()
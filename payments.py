@@ -0,0 +1,151 @@
+# payments.py
+import csv
+import io
+import os
+import re
+
+from sqlalchemy import select, update
+
+from models import CompleteProfile
+from session_state import bump_session_version
+from stats import students_status_changed
+
+# =========================
+# Bulk activation / fee reconciliation
+# =========================
+# Students are activated or blocked many at a time, either from a list of
+# profile ids or from a payments CSV (phone, amount). Matching is one indexed
+# IN lookup on contact_no; the change itself is one UPDATE; stats counters and
+# session versions move in the same transaction.
+
+# Total a phone must have paid (across CSV rows) to be activated
+TERM_FEE = float(os.environ.get("TERM_FEE", "0"))
+
+PHONE_HEADERS = ("phone", "phone_number", "phone number", "contact_no", "msisdn", "mobile")
+AMOUNT_HEADERS = ("amount", "paid", "amount_paid", "amount paid")
+
+_NON_DIGITS = re.compile(r"\D")
+COUNTRY_CODE = "254"
+
+
+class PaymentsFileError(ValueError):
+    """The uploaded payments file can't be read."""
+
+
+def canonical_phone(raw):
+    """One spelling per number: "+254 712 345 678", "0712345678" -> "254712345678"."""
+    digits = _NON_DIGITS.sub("", raw or "")
+    if digits.startswith("0") and len(digits) == 10:
+        return COUNTRY_CODE + digits[1:]
+    if len(digits) == 9 and digits[0] in "17":
+        return COUNTRY_CODE + digits
+    return digits
+
+
+def phone_variants(raw):
+    """The ways a number is commonly typed into contact_no, for an exact IN lookup."""
+    canonical = canonical_phone(raw)
+    variants = {canonical, (raw or "").strip()}
+    if canonical.startswith(COUNTRY_CODE) and len(canonical) == 12:
+        local = canonical[len(COUNTRY_CODE):]
+        variants.update({"+" + canonical, "0" + local, local})
+    variants.discard("")
+    return variants
+
+
+def read_payments_csv(file):
+    """{canonical phone: (phone as written, total amount)} from an uploaded CSV."""
+    text = io.TextIOWrapper(file.stream, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        header = [h.strip().lower() for h in next(reader, [])]
+        phone_col = next((i for i, h in enumerate(header) if h in PHONE_HEADERS), None)
+        amount_col = next((i for i, h in enumerate(header) if h in AMOUNT_HEADERS), None)
+        if phone_col is None or amount_col is None:
+            raise PaymentsFileError("CSV needs a phone column and an amount column.")
+
+        payments = {}
+        for line_no, row in enumerate(reader, start=2):
+            if len(row) <= max(phone_col, amount_col) or not row[phone_col].strip():
+                continue
+            try:
+                amount = float(row[amount_col].replace(",", "").strip() or 0)
+            except ValueError:
+                raise PaymentsFileError(f"Line {line_no}: amount {row[amount_col]!r} is not a number.")
+            key = canonical_phone(row[phone_col])
+            written, total = payments.get(key, (row[phone_col].strip(), 0.0))
+            payments[key] = (written, total + amount)
+        return payments
+    except UnicodeDecodeError:
+        raise PaymentsFileError("CSV must be UTF-8 text.")
+    finally:
+        text.detach()
+
+
+def _apply(db, profiles, active):
+    """One UPDATE for every profile not already in the wanted state; returns those."""
+    changing = [p for p in profiles if bool(p.is_active) != active]
+    if changing:
+        db.execute(
+            update(CompleteProfile)
+            .where(CompleteProfile.id.in_([p.id for p in changing]))
+            .values(is_active=active)
+        )
+        students_status_changed(db, [p.form for p in changing], active)
+        bump_session_version(db, *[p.user_id for p in changing])
+    return changing
+
+
+def _profile_rows(db, condition):
+    return db.execute(
+        select(CompleteProfile.id, CompleteProfile.user_id, CompleteProfile.first_name,
+               CompleteProfile.last_name, CompleteProfile.form, CompleteProfile.contact_no,
+               CompleteProfile.is_active)
+        .where(condition)
+    ).all()
+
+
+def _student(row, **extra):
+    return dict(id=row.id, name=f"{row.first_name} {row.last_name}", form=row.form,
+                contact_no=row.contact_no, **extra)
+
+
+def set_students_active(db, student_ids, active):
+    """Activate (or block) the given profile ids. The caller commits."""
+    wanted = set(student_ids)
+    rows = _profile_rows(db, CompleteProfile.id.in_(wanted)) if wanted else []
+    changed = _apply(db, rows, active)
+    changed_ids = {row.id for row in changed}
+    return {
+        "action": "activate" if active else "block",
+        "changed": [_student(row) for row in changed],
+        "unchanged": [_student(row) for row in rows if row.id not in changed_ids],
+        "unmatched": sorted(wanted - {row.id for row in rows}),
+    }
+
+
+def reconcile_payments(db, payments, fee=TERM_FEE):
+    """Activate students whose phone paid at least `fee` in `payments`. The caller commits."""
+    variants = set()
+    for phone, _ in payments.values():
+        variants |= phone_variants(phone)
+    rows = _profile_rows(db, CompleteProfile.contact_no.in_(variants)) if variants else []
+
+    by_phone = {}
+    for row in rows:
+        by_phone.setdefault(canonical_phone(row.contact_no), []).append(row)
+
+    paid_up, short = [], []
+    for key, (phone, amount) in payments.items():
+        for row in by_phone.get(key, ()):
+            (paid_up if amount >= fee else short).append((row, amount))
+
+    changed = _apply(db, [row for row, _ in paid_up], True)
+    changed_ids = {row.id for row in changed}
+    return {
+        "action": "reconcile",
+        "changed": [_student(row, amount=amount) for row, amount in paid_up if row.id in changed_ids],
+        "unchanged": [_student(row, amount=amount) for row, amount in paid_up if row.id not in changed_ids],
+        "underpaid": [_student(row, amount=amount) for row, amount in short],
+        "unmatched": sorted(phone for key, (phone, _) in payments.items() if key not in by_phone),
+    }
@@ -0,0 +1,76 @@
+# precompress.py
+# Build/deploy step: writes .gz (and .br when the brotli package is installed)
+# next to every compressible file under static/, at maximum compression, so
+# compression.serve_static() can send them without compressing per request.
+# A variant is kept only if it is at least MIN_SAVING smaller; already
+# compressed formats (PNG, JPEG, PDF, ...) never are. Uploaded materials
+# are left alone.
+#
+#   python precompress.py            -> refresh stale/missing variants
+#   python precompress.py --clean    -> delete every variant
+import gzip
+import os
+import sys
+
+from compression import STATIC_ENCODINGS, brotli
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+SKIP_DIRS = {"materials"}
+SKIP_SUFFIXES = {suffix for _, suffix in STATIC_ENCODINGS}
+MIN_SAVING = 0.1
+
+
+def _static_files():
+    for root, dirs, files in os.walk(STATIC_FOLDER):
+        if root == STATIC_FOLDER:
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in files:
+            yield os.path.join(root, name)
+
+
+def _compressors():
+    compressors = {".gz": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors[".br"] = lambda data: brotli.compress(data, quality=11)
+    return compressors
+
+
+def precompress():
+    compressors = _compressors()
+    for path in _static_files():
+        if os.path.splitext(path)[1] in SKIP_SUFFIXES:
+            continue
+        data = None
+        for suffix, compress in compressors.items():
+            variant = path + suffix
+            if os.path.exists(variant) and os.path.getmtime(variant) >= os.path.getmtime(path):
+                continue
+            if data is None:
+                with open(path, "rb") as f:
+                    data = f.read()
+            compressed = compress(data)
+            name = os.path.relpath(variant, STATIC_FOLDER)
+            if len(compressed) > len(data) * (1 - MIN_SAVING):
+                if os.path.exists(variant):
+                    os.remove(variant)
+                print(f"– {name}: skipped, saves under {MIN_SAVING:.0%}")
+                continue
+            tmp = variant + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(compressed)
+            os.replace(tmp, variant)
+            print(f"✅ {name}: {len(data)} -> {len(compressed)} bytes")
+
+
+def clean():
+    for path in _static_files():
+        if os.path.splitext(path)[1] in SKIP_SUFFIXES:
+            os.remove(path)
+            print(f"🗑 {os.path.relpath(path, STATIC_FOLDER)}")
+
+
+if __name__ == "__main__":
+    if "--clean" in sys.argv[1:]:
+        clean()
+    else:
+        precompress()
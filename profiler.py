@@ -0,0 +1,255 @@
+# profiler.py
+import _thread
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import request, session
+
+from passwords import gevent_patched
+
+# =========================
+# On-demand request profiler
+# =========================
+# A stack sampler that runs for one request only, when asked:
+#   - an admin session plus `X-Profile: 1` (or ?profile=1), or
+#   - `X-Profile-Token: <PROFILE_TOKEN>`, for pages an admin can't open
+#     (e.g. /student while logged in as a student).
+# A background thread snapshots the request thread's stack every
+# PROFILE_INTERVAL_MS; the request itself runs untouched, so the overhead is
+# the sampler's share of the GIL and nothing at all for unprofiled requests.
+# While any sampler runs, the interpreter's GIL switch interval (5 ms by
+# default) is lowered to the sampling interval, otherwise a CPU-bound request
+# would starve the sampler of the GIL.
+#
+# Under the gevent worker (gunicorn.conf.py) "threads" are greenlets that
+# only switch on I/O, so the sampler runs on a real OS thread from gevent's
+# originals and samples the request greenlet: the running OS thread's stack
+# while it runs, its suspended frame (where it waits) while it doesn't.
+#
+# The samples are written as collapsed stacks ("a;b;c <count>" per line, the
+# input of flamegraph.pl / speedscope) under instance/profiles/, and the
+# response carries a short summary of where the time went:
+#   X-Profile-Summary: samples=212 sqlalchemy=41% jinja2=33% app=14% werkzeug=4% other=8%
+
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "2"))
+# Oldest profiles are removed beyond this many files
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "200"))
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Leaf frames are charged to the first of these they (or a caller) belong to
+_CATEGORIES = (
+    ("sqlalchemy", os.sep + "sqlalchemy" + os.sep),
+    ("jinja2", os.sep + "jinja2" + os.sep),
+    ("jinja2", os.path.join(_APP_DIR, "templates") + os.sep),
+    ("werkzeug", os.sep + "werkzeug" + os.sep),
+    ("flask", os.sep + "flask" + os.sep),
+)
+
+
+def _category(filename):
+    for name, marker in _CATEGORIES:
+        if marker in filename:
+            return name
+    if filename.startswith(_APP_DIR) and os.sep + "site-packages" + os.sep not in filename:
+        return "app"
+    return None
+
+
+_labels = {}
+
+
+def _label(code):
+    """"module.py:function" for a code object (cached: code objects are long-lived)."""
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(_APP_DIR):
+            short = os.path.relpath(filename, _APP_DIR)
+        elif "site-packages" + os.sep in filename:
+            short = filename.split("site-packages" + os.sep, 1)[1]
+        else:
+            short = os.path.basename(filename)
+        label = _labels[code] = f"{short}:{code.co_name}"
+    return label
+
+
+def _os_threading():
+    """(start_new_thread, allocate_lock, sleep, get_ident) working on real OS threads."""
+    if gevent_patched():
+        from gevent.monkey import get_original
+
+        return tuple(get_original(module, name) for module, name in (
+            ("_thread", "start_new_thread"), ("_thread", "allocate_lock"), ("time", "sleep"), ("_thread", "get_ident")))
+    return _thread.start_new_thread, _thread.allocate_lock, time.sleep, _thread.get_ident
+
+
+_switch_lock = _thread.allocate_lock()
+_active_samplers = 0
+_saved_switch_interval = None
+
+
+def _enter_sampling(interval):
+    global _active_samplers, _saved_switch_interval
+    with _switch_lock:
+        if _active_samplers == 0:
+            _saved_switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(interval, _saved_switch_interval))
+        _active_samplers += 1
+
+
+def _leave_sampling():
+    global _active_samplers
+    with _switch_lock:
+        _active_samplers -= 1
+        if _active_samplers == 0:
+            sys.setswitchinterval(_saved_switch_interval)
+
+
+class Sampler:
+    """Samples one thread's (or greenlet's) stack from a background OS thread until stop()."""
+
+    def __init__(self, thread_id, interval, greenlet=None):
+        self.thread_id = thread_id
+        self.greenlet = greenlet
+        self.interval = interval
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self._start_thread, allocate_lock, self._sleep, _ = _os_threading()
+        self._stopped = False
+        self._done = allocate_lock()
+
+    @classmethod
+    def for_current(cls, interval):
+        """A sampler for the calling thread, or the calling greenlet under gevent."""
+        if gevent_patched():
+            from gevent import getcurrent
+
+            return cls(_os_threading()[3](), interval, greenlet=getcurrent())
+        return cls(threading.get_ident(), interval)
+
+    def start(self):
+        _enter_sampling(self.interval)
+        self._done.acquire()
+        self._start_thread(self._run, ())
+        return self
+
+    def stop(self):
+        self._stopped = True
+        # A plain lock, not threading.Event: that one is a greenlet primitive under gevent
+        self._done.acquire()
+        self._done.release()
+        _leave_sampling()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _current_frame(self):
+        frames = sys._current_frames()
+        if self.greenlet is not None:
+            if self.greenlet.dead:
+                return None
+            if self.greenlet.gr_frame is not None:
+                return self.greenlet.gr_frame  # switched out: waiting on I/O or another greenlet
+        return frames.get(self.thread_id)
+
+    def _run(self):
+        try:
+            self._sample()
+        finally:
+            self._done.release()
+
+    def _sample(self):
+        while True:
+            self._sleep(self.interval)
+            if self._stopped:
+                break
+            frame = self._current_frame()
+            if frame is None:
+                break
+            labels = []
+            category = None
+            while frame is not None:
+                labels.append(_label(frame.f_code))
+                if category is None:
+                    category = _category(frame.f_code.co_filename)
+                frame = frame.f_back
+            del frame
+            labels.reverse()
+            self.stacks[";".join(labels)] += 1
+            self.categories[category or "other"] += 1
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def summary(self):
+        total = self.samples or 1
+        parts = [f"samples={self.samples}"]
+        parts.extend(f"{name}={count * 100 // total}%" for name, count in self.categories.most_common())
+        return " ".join(parts)
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def profile_folder(instance_path):
+    folder = os.path.join(instance_path, "profiles")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _prune(folder):
+    names = sorted(n for n in os.listdir(folder) if n.endswith(".folded"))
+    for name in names[:max(0, len(names) - PROFILE_KEEP)]:
+        try:
+            os.remove(os.path.join(folder, name))
+        except OSError:
+            pass
+
+
+def profiling_requested():
+    token = request.headers.get("X-Profile-Token", "")
+    if PROFILE_TOKEN and token and hmac.compare_digest(token, PROFILE_TOKEN):
+        return True
+    flag = request.headers.get("X-Profile") or request.args.get("profile")
+    return flag == "1" and session.get("role") == "admin"
+
+
+def init_profiler(app):
+    """Register the per-request hooks on `app`."""
+
+    @app.before_request
+    def _start_profiler():
+        if profiling_requested():
+            request.environ["profiler.sampler"] = Sampler.for_current(PROFILE_INTERVAL_MS / 1000).start()
+
+    @app.after_request
+    def _save_profile(response):
+        sampler = request.environ.pop("profiler.sampler", None)
+        if sampler is None:
+            return response
+        sampler.stop()
+        folder = profile_folder(app.instance_path)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unmatched'}-{uuid.uuid4().hex[:6]}.folded"
+        sampler.write(os.path.join(folder, name))
+        _prune(folder)
+        response.headers["X-Profile-File"] = name
+        response.headers["X-Profile-Summary"] = sampler.summary()
+        response.headers["X-Profile-Time"] = f"{sampler.elapsed * 1000:.1f}ms"
+        return response
+
+    @app.teardown_request
+    def _stop_profiler(exc):
+        # The view raised before after_request could stop it
+        sampler = request.environ.pop("profiler.sampler", None)
+        if sampler is not None:
+            sampler.stop()
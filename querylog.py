@@ -0,0 +1,185 @@
+# querylog.py
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+# =========================
+# Statement fingerprints + slow-query log
+# =========================
+# A small in-process pg_stat_statements. Every SQL statement is reduced to a
+# fingerprint (literals, bind placeholders, IN-lists and multi-row VALUES
+# collapsed) and aggregated: calls, total / mean / p95 / max time, rows
+# (cursor.rowcount, so SELECTs only count on drivers that report it, e.g. psycopg2).
+# Statements slower than SLOW_QUERY_MS are logged with the Flask route and the
+# application line that issued them, at most once per SLOW_QUERY_LOG_INTERVAL
+# for each (fingerprint, line), with a count of the ones suppressed meanwhile;
+# nothing else is logged, so this is cheap enough to leave on (unlike DB_ECHO).
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_INTERVAL = float(os.environ.get("SLOW_QUERY_LOG_INTERVAL", "60"))
+QUERY_LOG_ENABLED = os.environ.get("QUERY_LOG_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+# Bounded memory: fingerprints beyond this are counted under OVERFLOW_KEY
+MAX_FINGERPRINTS = int(os.environ.get("QUERY_LOG_MAX_FINGERPRINTS", "2000"))
+# Recent durations kept per fingerprint for the p95
+SAMPLES_PER_FINGERPRINT = 256
+OVERFLOW_KEY = "<other statements>"
+
+logger = logging.getLogger("slow_query")
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+|\?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_ROWS = re.compile(r"(\([^()]*\))(?:\s*,\s*\([^()]*\))+")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement):
+    """Normalized statement text: the same query with other values maps to one key."""
+    text = _STRING.sub("?", statement)
+    text = _PLACEHOLDER.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _IN_LIST.sub("IN (...)", text)
+    text = _VALUES_ROWS.sub(r"\1, ...", text)
+    return _SPACE.sub(" ", text).strip()
+
+
+class StatementStats:
+    __slots__ = ("calls", "total", "max", "rows", "samples")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples = deque(maxlen=SAMPLES_PER_FINGERPRINT)
+
+    def as_dict(self):
+        samples = sorted(self.samples)
+        p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0
+        return {
+            "calls": self.calls,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total * 1000 / self.calls if self.calls else 0.0,
+            "p95_ms": p95 * 1000,
+            "max_ms": self.max * 1000,
+            "rows": self.rows,
+        }
+
+
+_stats = {}
+_lock = threading.Lock()
+# (fingerprint, call site) -> [last logged (monotonic), suppressed since], least recently logged first
+_logged_slow = OrderedDict()
+
+
+def _call_site():
+    """First frame in this app's own code that led to the statement."""
+    for frame in reversed(traceback.extract_stack()[:-3]):
+        if frame.filename.startswith(_APP_DIR) and not frame.filename.endswith("querylog.py"):
+            return f"{os.path.relpath(frame.filename, _APP_DIR)}:{frame.lineno} in {frame.name}"
+    return "?"
+
+
+def _slow_log_due(key):
+    """Slow statements suppressed for `key` since it was last logged, or None if it isn't due yet."""
+    now = time.monotonic()
+    with _lock:
+        entry = _logged_slow.get(key)
+        if entry is not None and now - entry[0] < SLOW_QUERY_LOG_INTERVAL:
+            entry[1] += 1
+            return None
+        suppressed = entry[1] if entry is not None else 0
+        _logged_slow[key] = [now, 0]
+        _logged_slow.move_to_end(key)
+        if len(_logged_slow) > MAX_FINGERPRINTS:
+            _logged_slow.popitem(last=False)
+        return suppressed
+
+
+def record(statement, elapsed, rows):
+    key = fingerprint(statement)
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            if len(_stats) >= MAX_FINGERPRINTS:
+                key = OVERFLOW_KEY
+                entry = _stats.get(key)
+            if entry is None:
+                entry = _stats[key] = StatementStats()
+        entry.calls += 1
+        entry.total += elapsed
+        entry.max = max(entry.max, elapsed)
+        if rows and rows > 0:
+            entry.rows += rows
+        entry.samples.append(elapsed)
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        route = request.endpoint if has_request_context() else None
+        site = _call_site()
+        # The statement's own fingerprint, even once the stats have overflowed
+        key = fingerprint(statement)
+        suppressed = _slow_log_due((key, site))
+        if suppressed is not None:
+            logger.warning("slow query %.1f ms route=%s at %s%s: %s", elapsed * 1000, route or "-", site,
+                           f" ({suppressed} more since last logged)" if suppressed else "", key)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("querylog_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["querylog_started"].pop()
+    record(statement, time.perf_counter() - started, cursor.rowcount)
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("querylog_started"):
+        conn.info["querylog_started"].pop()
+
+
+def init_query_log(*engines):
+    if not QUERY_LOG_ENABLED:
+        return
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+def query_stats(sort="total_ms", limit=50):
+    """[(fingerprint, stats dict)] sorted by `sort`, biggest first."""
+    with _lock:
+        rows = [(key, entry.as_dict()) for key, entry in _stats.items()]
+    rows.sort(key=lambda item: item[1][sort], reverse=True)
+    return rows[:limit]
+
+
+def reset_query_stats():
+    with _lock:
+        _stats.clear()
+        _logged_slow.clear()
+
+
+def render_query_stats(sort="total_ms", limit=50):
+    """Plain-text table, like SELECT ... FROM pg_stat_statements ORDER BY <sort>."""
+    lines = [f"{'calls':>8} {'total ms':>10} {'mean ms':>9} {'p95 ms':>9} {'max ms':>9} {'rows':>8}  statement"]
+    for key, s in query_stats(sort, limit):
+        lines.append(
+            f"{s['calls']:>8} {s['total_ms']:>10.1f} {s['mean_ms']:>9.2f} {s['p95_ms']:>9.2f} "
+            f"{s['max_ms']:>9.2f} {s['rows']:>8}  {key}"
+        )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,57 @@
+# replicas.py
+import os
+import time
+
+from flask import request, session
+
+from connections import RoutingState, replica_engines, routing_state
+
+# =========================
+# Read-replica routing for Flask views
+# =========================
+# Views tagged @read_only read from a replica on GET/HEAD (see RoutingSession
+# in connections.py); everything else uses the primary. After a request that
+# wrote anything, the same browser session reads from the primary for
+# REPLICA_STICKY_SECONDS, so a user sees their own change (new profile, added
+# material) on the redirect that follows it even if the replicas lag.
+
+REPLICA_STICKY_SECONDS = float(os.environ.get("REPLICA_STICKY_SECONDS", "10"))
+
+
+def read_only(view):
+    """Let GET/HEAD requests to this view read from a replica.
+
+    Only tags the function, like metrics.query_budget.
+    """
+    view.read_only = True
+    return view
+
+
+def init_replica_routing(app):
+    """Register the per-request hooks on `app` (no-op without DATABASE_REPLICA_URLS)."""
+    if not replica_engines:
+        return
+
+    @app.before_request
+    def _choose_database():
+        view = app.view_functions.get(request.endpoint)
+        use_replica = (
+            request.method in ("GET", "HEAD")
+            and getattr(view, "read_only", False)
+            and session.get("primary_until", 0) < time.time()
+        )
+        request.environ["replicas.token"] = routing_state.set(RoutingState(use_replica))
+
+    @app.after_request
+    def _stick_to_primary(response):
+        state = routing_state.get()
+        # Any POST counts: some routes leave their commit to the teardown
+        if state is not None and (state.wrote or request.method not in ("GET", "HEAD")):
+            session["primary_until"] = time.time() + REPLICA_STICKY_SECONDS
+        return response
+
+    @app.teardown_request
+    def _reset_routing(exc):
+        token = request.environ.pop("replicas.token", None)
+        if token is not None:
+            routing_state.reset(token)
@@ -0,0 +1,141 @@
+# search.py
+import re
+
+from sqlalchemy import func, literal_column, text
+
+from models import CompleteProfile
+
+# =========================
+# Student roster search
+# =========================
+# Postgres: pg_trgm GIN index over one lower-cased "document" expression, which
+# serves both LIKE '%q%' and similarity() ranking.
+# SQLite (dev/bench): an external-content FTS5 table with the trigram tokenizer,
+# kept in sync by triggers and ranked with bm25().
+# Phone numbers are matched as a prefix range on the (contact_no, id) index.
+
+# The index and the query must use exactly this expression
+STUDENT_DOCUMENT_SQL = (
+    "lower(first_name || ' ' || coalesce(middle_name, '') || ' ' || last_name || ' ' || form)"
+)
+TRGM_INDEX = "ix_complete_profile_search_trgm"
+FTS_TABLE = "complete_profile_fts"
+
+# Trigram indexes cannot help with anything shorter than a trigram
+MIN_INDEXED_QUERY = 3
+
+_PHONE_QUERY = re.compile(r"^\+?[\d\s-]+$")
+_FTS_COLUMNS = "first_name, middle_name, last_name, form"
+
+_index_available = {}
+
+
+def install_search_index(conn):
+    """Create the search index for this database (idempotent)."""
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {TRGM_INDEX} ON complete_profile "
+            f"USING gin (({STUDENT_DOCUMENT_SQL}) gin_trgm_ops)"
+        ))
+    elif dialect == "sqlite":
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"{_FTS_COLUMNS}, content='complete_profile', content_rowid='id', tokenize='trigram')"
+        ))
+        new_values = "new.id, new.first_name, new.middle_name, new.last_name, new.form"
+        old_values = "old.id, old.first_name, old.middle_name, old.last_name, old.form"
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON complete_profile BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, {_FTS_COLUMNS}) VALUES ({new_values}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON complete_profile BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_FTS_COLUMNS}) VALUES ('delete', {old_values}); END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON complete_profile BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_FTS_COLUMNS}) VALUES ('delete', {old_values}); "
+            f"INSERT INTO {FTS_TABLE}(rowid, {_FTS_COLUMNS}) VALUES ({new_values}); END"
+        ))
+        # Index rows that existed before the table did
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    _index_available.clear()
+
+
+def _has_search_index(db):
+    bind = db.get_bind()
+    key = str(bind.url)
+    if key not in _index_available:
+        if bind.dialect.name == "postgresql":
+            found = db.execute(text("SELECT 1 FROM pg_indexes WHERE indexname = :name"),
+                               {"name": TRGM_INDEX}).first()
+        elif bind.dialect.name == "sqlite":
+            found = db.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                               {"name": FTS_TABLE}).first()
+        else:
+            found = None
+        _index_available[key] = found is not None
+    return _index_available[key]
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _phone_prefix(query):
+    """contact_no range for a phone-number prefix, or None if `query` isn't one."""
+    if not _PHONE_QUERY.match(query):
+        return None
+    prefix = re.sub(r"[\s-]", "", query)
+    if not prefix:
+        return None
+    # "0712" -> ["0712", "0713"): an index range scan on any dialect/collation
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return (CompleteProfile.contact_no >= prefix) & (CompleteProfile.contact_no < upper)
+
+
+def _like_fallback(db, query, limit):
+    pattern = f"%{_escape_like(query)}%"
+    return db.query(CompleteProfile).filter(
+        func.lower(CompleteProfile.first_name).like(pattern, escape="\\") |
+        func.lower(CompleteProfile.last_name).like(pattern, escape="\\") |
+        func.lower(CompleteProfile.form).like(pattern, escape="\\") |
+        CompleteProfile.contact_no.like(pattern, escape="\\")
+    ).order_by(CompleteProfile.id).limit(limit).all()
+
+
+def search_students(db, query, limit=50):
+    """Best matches for `query` (names, form or phone prefix), best first."""
+    query = " ".join(query.split()).lower()
+    if not query:
+        return []
+
+    phone = _phone_prefix(query)
+    if phone is not None:
+        return db.query(CompleteProfile).filter(phone).order_by(
+            CompleteProfile.contact_no, CompleteProfile.id
+        ).limit(limit).all()
+
+    if len(query) < MIN_INDEXED_QUERY or not _has_search_index(db):
+        return _like_fallback(db, query, limit)
+
+    if db.get_bind().dialect.name == "postgresql":
+        document = literal_column(f"({STUDENT_DOCUMENT_SQL})")
+        return db.query(CompleteProfile).filter(
+            document.like(f"%{_escape_like(query)}%", escape="\\")
+        ).order_by(
+            func.similarity(document, query).desc(), CompleteProfile.id
+        ).limit(limit).all()
+
+    # SQLite FTS5: quote the query so it is matched as one trigram phrase
+    phrase = '"' + query.replace('"', '""') + '"'
+    ranked_ids = db.execute(text(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :phrase "
+        f"ORDER BY bm25({FTS_TABLE}) LIMIT :limit"
+    ), {"phrase": phrase, "limit": limit}).scalars().all()
+    if not ranked_ids:
+        return []
+    rows = {row.id: row for row in db.query(CompleteProfile).filter(CompleteProfile.id.in_(ranked_ids))}
+    return [rows[row_id] for row_id in ranked_ids if row_id in rows]
@@ -0,0 +1,98 @@
+# session_state.py
+import os
+
+from flask import session
+from sqlalchemy import update
+
+from cache import TTLCache
+from models import CompleteProfile, Teacher, User
+
+# =========================
+# Account state cached in the (signed) session cookie
+# =========================
+# Login loads the user, teacher profile and student profile in one joined
+# query and keeps the non-sensitive bits the dashboards need in the session:
+# role, display name, form, paid/approved flags. The cookie is signed, not
+# encrypted, so contact details (phone numbers, guardian) are never stored
+# here; pages that show them read them from the database.
+# Dashboards trust that copy for as long as its version matches
+# users.session_version, which admin actions bump.
+
+SESSION_KEY = "account"
+# Bump when the shape of the payload changes so old cookies get rebuilt
+PAYLOAD_SCHEMA = 2
+
+# How long a worker trusts its copy of a user's session_version. Admin
+# actions on this worker take effect at once; on other workers within this TTL.
+SESSION_VERSION_TTL = int(os.environ.get("SESSION_VERSION_TTL", "30"))
+
+session_version_cache = TTLCache(maxsize=10000, ttl=SESSION_VERSION_TTL)
+
+
+def account_query(db):
+    """User plus optional teacher/student profile, in one round trip."""
+    return (
+        db.query(User, Teacher, CompleteProfile)
+        .outerjoin(Teacher, Teacher.user_id == User.id)
+        .outerjoin(CompleteProfile, CompleteProfile.user_id == User.id)
+    )
+
+
+def remember_account(user, teacher=None, profile=None):
+    state = {
+        "schema": PAYLOAD_SCHEMA,
+        "version": user.session_version,
+        "role": user.role,
+        "has_profile": teacher is not None or profile is not None,
+    }
+    if teacher is not None:
+        state.update(
+            name=teacher.teacher_name,
+            subject=teacher.subject,
+            approved=bool(teacher.is_approved),
+        )
+    elif profile is not None:
+        state.update(
+            name=f"{profile.first_name} {profile.last_name}",
+            form=profile.form,
+            is_active=bool(profile.is_active),
+        )
+    session[SESSION_KEY] = state
+    session_version_cache.set(user.id, user.session_version)
+    return state
+
+
+def _current_version(db, user_id):
+    version = session_version_cache.get(user_id)
+    if version is None:
+        version = db.query(User.session_version).filter(User.id == user_id).scalar()
+        if version is not None:
+            session_version_cache.set(user_id, version)
+    return version
+
+
+def current_account(db):
+    """Account state for the logged-in user, or None if the user is gone."""
+    user_id = session.get("user_id")
+    if not user_id:
+        return None
+    state = session.get(SESSION_KEY)
+    if (state and state.get("schema") == PAYLOAD_SCHEMA
+            and state.get("version") == _current_version(db, user_id)):
+        return state
+
+    row = account_query(db).filter(User.id == user_id).first()
+    if row is None:
+        return None
+    return remember_account(*row)
+
+
+def bump_session_version(db, *user_ids):
+    """Make the cached session state of these users stale."""
+    if not user_ids:
+        return
+    db.execute(
+        update(User).where(User.id.in_(user_ids)).values(session_version=User.session_version + 1)
+    )
+    for user_id in user_ids:
+        session_version_cache.pop(user_id)
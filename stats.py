@@ -0,0 +1,132 @@
+# stats.py
+from collections import Counter
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import CompleteProfile, StatCounter, Teacher, User, normalize_form
+
+# =========================
+# Incremental dashboard counters
+# =========================
+# Counter names:
+#   students.active.<form key> / students.blocked.<form key>
+#   teachers.approved / teachers.pending
+#   users.<role>
+# Every helper takes the route's session so the counter moves in the same
+# transaction as the row it describes.
+
+def _student_counter(form, is_active):
+    return f"students.{'active' if is_active else 'blocked'}.{normalize_form(form)}"
+
+
+def _teacher_counter(is_approved):
+    return "teachers.approved" if is_approved else "teachers.pending"
+
+
+def increment(db, model, keys, column, delta=1):
+    """Atomically add `delta` to `column` of the `model` row with primary key `keys`, creating it if needed."""
+    dialect = db.get_bind().dialect.name
+    target = getattr(model, column)
+    if dialect in ("postgresql", "sqlite"):
+        upsert = (postgresql if dialect == "postgresql" else sqlite).insert(model)
+        stmt = upsert.values(**keys, **{column: delta}).on_conflict_do_update(
+            index_elements=[getattr(model, k) for k in keys],
+            set_={column: target + delta},
+        )
+        db.execute(stmt)
+        return
+    condition = [getattr(model, k) == v for k, v in keys.items()]
+    result = db.execute(update(model).where(*condition).values({column: target + delta}))
+    if not result.rowcount:
+        db.execute(insert(model).values(**keys, **{column: delta}))
+
+
+def bump(db, name, delta=1):
+    """Atomically add `delta` to counter `name`, creating it if needed."""
+    if delta:
+        increment(db, StatCounter, {"name": name}, "value", delta)
+
+
+def user_registered(db, role, count=1):
+    bump(db, f"users.{role}", count)
+
+
+def student_added(db, form, is_active=False, count=1):
+    bump(db, _student_counter(form, is_active), count)
+
+
+def student_changed(db, old_form, old_active, new_form, new_active):
+    """Move one student between (form, active/blocked) buckets."""
+    old_name = _student_counter(old_form, old_active)
+    new_name = _student_counter(new_form, new_active)
+    if old_name != new_name:
+        bump(db, old_name, -1)
+        bump(db, new_name, 1)
+
+
+def students_status_changed(db, forms, new_active):
+    """Move many students (one form per student) into the active or blocked bucket."""
+    for form, count in Counter(normalize_form(form) for form in forms).items():
+        bump(db, _student_counter(form, not new_active), -count)
+        bump(db, _student_counter(form, new_active), count)
+
+
+def teacher_added(db, is_approved=False, count=1):
+    bump(db, _teacher_counter(is_approved), count)
+
+
+def teacher_changed(db, old_approved, new_approved):
+    if bool(old_approved) != bool(new_approved):
+        bump(db, _teacher_counter(old_approved), -1)
+        bump(db, _teacher_counter(new_approved), 1)
+
+
+def read_dashboard_stats(db):
+    """All counters in one query, shaped for the admin dashboard."""
+    counters = dict(db.execute(select(StatCounter.name, StatCounter.value)).all())
+
+    forms = {}
+    for name, value in counters.items():
+        if name.startswith("students."):
+            _, status, form = name.split(".", 2)
+            forms.setdefault(form, {"active": 0, "blocked": 0})[status] += value
+
+    active_students = sum(f["active"] for f in forms.values())
+    blocked_students = sum(f["blocked"] for f in forms.values())
+    return {
+        "total_students": active_students + blocked_students,
+        "active_students": active_students,
+        "blocked_students": blocked_students,
+        "students_by_form": sorted(forms.items()),
+        "total_teachers": counters.get("teachers.approved", 0) + counters.get("teachers.pending", 0),
+        "approved_teachers": counters.get("teachers.approved", 0),
+        "pending_teachers": counters.get("teachers.pending", 0),
+        "users_by_role": {
+            name.split(".", 1)[1]: value for name, value in counters.items() if name.startswith("users.")
+        },
+    }
+
+
+def rebuild_stats(conn):
+    """Recount everything from the source tables (backfill / drift repair)."""
+    counts = {}
+    rows = conn.execute(
+        select(CompleteProfile.form, CompleteProfile.is_active, func.count())
+        .group_by(CompleteProfile.form, CompleteProfile.is_active)
+    ).all()
+    for form, is_active, count in rows:
+        name = _student_counter(form, is_active)
+        counts[name] = counts.get(name, 0) + count
+
+    rows = conn.execute(select(Teacher.is_approved, func.count()).group_by(Teacher.is_approved)).all()
+    for is_approved, count in rows:
+        name = _teacher_counter(is_approved)
+        counts[name] = counts.get(name, 0) + count
+
+    for role, count in conn.execute(select(User.role, func.count()).group_by(User.role)).all():
+        counts[f"users.{role}"] = count
+
+    conn.execute(delete(StatCounter))
+    if counts:
+        conn.execute(insert(StatCounter), [{"name": k, "value": v} for k, v in counts.items()])
@@ -0,0 +1,110 @@
+# storage.py
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from flask import Request, current_app
+from werkzeug.utils import secure_filename
+
+# =========================
+# Content-addressed material storage
+# =========================
+# Uploads are written to a temp file in UPLOAD_TMP_FOLDER while they are
+# being received, hashed on the way in, and then hard-linked to
+# <sha256[:2]>/<sha256><ext> in the upload folder. Identical files are stored once and two
+# different files can never overwrite each other.
+
+CHUNK_SIZE = 64 * 1024
+# NamedTemporaryFile creates 0600 files; a stored material must be readable by
+# the web server (X-Accel-Redirect / X-Sendfile), like a file.save() would be
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+STORED_FILE_MODE = 0o644 & ~_UMASK
+TMP_DIRNAME = ".incoming"
+
+StoredFile = namedtuple("StoredFile", "name size sha256")
+
+
+class HashingTempFile:
+    """Write-through temp file that keeps a running sha256 and size."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        # Deleted on close: the stored copy is a hard link, not this name
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix="upload-")
+        self.name = self._file.name
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        # read/seek/tell/flush/close... go straight to the real file
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class UploadRequest(Request):
+    """Flask request whose multipart file parts stream into HashingTempFile.
+
+    Werkzeug would otherwise spool each file in memory/a temp file first and
+    file.save() would copy it again. Enabled by the UPLOAD_TMP_FOLDER config key.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        tmp_dir = current_app.config.get("UPLOAD_TMP_FOLDER")
+        if not tmp_dir:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return HashingTempFile(tmp_dir)
+
+
+def _extension(filename):
+    name = secure_filename(filename or "")
+    return os.path.splitext(name)[1].lower()
+
+
+def store_upload(file, folder):
+    """Store a werkzeug FileStorage under its content hash inside `folder`."""
+    stream = file.stream
+    if not isinstance(stream, HashingTempFile):
+        # Not parsed by UploadRequest: copy it through a hashing temp file
+        stream = HashingTempFile(current_app.config.get("UPLOAD_TMP_FOLDER") or os.path.join(folder, TMP_DIRNAME))
+        shutil.copyfileobj(file.stream, stream, CHUNK_SIZE)
+    stream.flush()
+
+    digest = stream.hash.hexdigest()
+    name = f"{digest[:2]}/{digest}{_extension(file.filename)}"
+    target = os.path.join(folder, name)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # The mode belongs to the inode, so it carries over to the hard link
+        os.chmod(stream.name, STORED_FILE_MODE)
+        try:
+            os.link(stream.name, target)
+        except FileExistsError:
+            pass  # the same file arrived concurrently
+        except OSError:
+            # No hard links on this filesystem: fall back to a copy + atomic rename
+            partial = f"{target}.{os.getpid()}.part"
+            shutil.copyfile(stream.name, partial)
+            os.chmod(partial, STORED_FILE_MODE)
+            os.replace(partial, target)
+    return StoredFile(name, stream.size, digest)
+
+
+def hash_file(path):
+    """(size, sha256) of a file already on disk."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()